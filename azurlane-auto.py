@@ -1,59 +1,162 @@
 import argparse
+import random
+from datetime import datetime, timedelta
+from functools import partial
 from modules.combat import CombatModule
 from modules.commission import CommissionModule
 from modules.mission import MissionModule
 from util.adb import Adb
 from util.config import Config
+from util.device import Device
+from util.fake_device import FakeDevice, VirtualClock
 from util.logger import Logger
+from util.metrics import Metrics
+from util.scheduler import Scheduler
+from util.state import StateStore
 from util.stats import Stats
+from util.utils import Utils
 
 
 class ALAuto(object):
-    modules = {
-        'commissions': None,
-        'combat': None,
-        'missions': None
-    }
 
     def __init__(self, config):
         """Initializes the primary azurlane-auto instance with the passed in
         Config instance; creates the Stats instance and resets scheduled sleep
-        timers.
+        timers, then restores the stats, module state and timers from the
+        state file if one is configured.
 
         Args:
             config (Config): azurlane-auto Config instance
         """
         self.config = config
         self.stats = Stats(config)
+        self.store = (StateStore(config.state['file'])
+                      if config.state['file'] else None)
+        self.next_runs = {}
+        self.modules = {
+            'commissions': None,
+            'combat': None,
+            'missions': None
+        }
         if self.config.commissions['enabled']:
             self.modules['commissions'] = CommissionModule(
                 self.config, self.stats)
         if self.config.combat['enabled']:
-            self.modules['combat'] = CombatModule(self.config, self.stats)
+            self.modules['combat'] = CombatModule(
+                self.config, self.stats, self.store)
         if self.config.missions['enabled']:
             self.modules['missions'] = MissionModule(self.config, self.stats)
+        if self.store:
+            self.store.register('stats', self.stats)
+            self.store.register('timers', self)
+            if self.modules['combat']:
+                self.store.register('combat', self.modules['combat'])
         self.print_stats_check = True
 
+    def get_state(self):
+        """Method to get the times of the next cycles for checkpointing.
+
+        Returns:
+            dict: dict of the cycle names to the times of their next run
+        """
+        return {name: when.isoformat()
+                for name, when in self.next_runs.items() if when is not None}
+
+    def set_state(self, state):
+        """Method to restore the checkpointed times of the next cycles.
+
+        Args:
+            state (dict): dict of the cycle names to the times of their next
+                run
+        """
+        self.next_runs = {name: datetime.fromisoformat(when)
+                          for name, when in state.items()}
+
+    def schedule(self, scheduler, device=None):
+        """Method to register the cycles of the enabled modules with the
+        scheduler. Commissions and missions are checked first. The cycles run
+        with the device active and never at the same time.
+
+        Args:
+            scheduler (Scheduler): Scheduler instance
+            device (Device, optional): Device the cycles drive; defaults to
+                the active device.
+        """
+        device = device or Device.current()
+        cycles = [
+            ('commissions', self.run_commission_cycle),
+            ('missions', self.run_mission_cycle),
+            ('combat', self.run_combat_cycle)
+        ]
+        for priority, (name, cycle) in enumerate(cycles):
+            if self.modules[name]:
+                label = name
+                if device.serial:
+                    label = '{} on {}'.format(name, device.serial)
+                scheduler.schedule(
+                    label, device.bind(partial(self.run_cycle, name, cycle)),
+                    self.next_runs.get(name), priority, device)
+
+    def run_cycle(self, name, cycle):
+        """Method to run a cycle, remembering when it next needs to run and
+        checkpointing the state afterwards.
+
+        Args:
+            name (string): Name of the cycle.
+            cycle (function): Cycle to run.
+
+        Returns:
+            datetime: time of the next run of the cycle, or None
+        """
+        self.next_runs[name] = cycle()
+        if self.store:
+            self.store.checkpoint()
+        return self.next_runs[name]
+
     def run_combat_cycle(self):
         """Method to run the combat cycle.
+
+        Returns:
+            datetime: time of the next combat cycle, or None if combat is
+            disabled
         """
-        if self.modules['combat']:
-            if self.modules['combat'].combat_logic_wrapper():
-                self.print_stats_check = True
+        if self.modules['combat'].combat_logic_wrapper():
+            self.print_stats_check = True
+        self.print_cycle_stats()
+        if not self.modules['combat'].enabled:
+            return None
+        return self.modules['combat'].next_combat_time
 
     def run_commission_cycle(self):
         """Method to run the expedition cycle.
+
+        Returns:
+            datetime: time of the next commission check
         """
-        if self.modules['commissions']:
-            if self.modules['commissions'].commissions_logic_wrapper():
-                self.print_stats_check = True
+        if self.modules['commissions'].commission_logic_wrapper():
+            self.print_stats_check = True
+        self.print_cycle_stats()
+        return self.next_check_time()
 
     def run_mission_cycle(self):
         """Method to run the mission cycle
+
+        Returns:
+            datetime: time of the next mission check
+        """
+        if self.modules['missions'].mission_logic_wrapper():
+            self.print_stats_check = True
+        self.print_cycle_stats()
+        return self.next_check_time()
+
+    def next_check_time(self):
+        """Method to get the time of the next commission or mission check.
+
+        Returns:
+            datetime: now plus the configured check interval
         """
-        if self.modules['missions']:
-            if self.modules['missions'].mission_logic_wrapper():
-                self.print_stats_check = True
+        return Utils.now() + timedelta(
+            seconds=self.config.scheduler['check_interval'])
 
     def print_cycle_stats(self):
         """Method to print the cycle stats"
@@ -79,20 +182,67 @@ parser.add_argument('-d', '--debug', nargs=2,
                     metavar=('IMAGE_FILE', 'SIMILARITY'),
                     help='Finds the specified image on the screen at ' +
                          'the specified similarity')
+parser.add_argument('-r', '--replay', metavar=('SOURCE'),
+                    help='Run against a simulated device that replays the ' +
+                         'screenshots in the specified directory or the ' +
+                         'specified JSON state machine script; nothing is ' +
+                         'saved to or restored from the state file')
+parser.add_argument('-D', '--device', action='append',
+                    metavar=('SERIAL[=CONFIG_FILE]'),
+                    help='Drive the device with the specified ADB serial, ' +
+                         'optionally with its own configuration file; ' +
+                         'may be given once per device')
+parser.add_argument('-w', '--workers', type=int,
+                    help='Number of devices to drive at the same time; ' +
+                         'defaults to the number of devices')
 parser.add_argument('--copyright',)
 args = parser.parse_args()
 # check args, and if none provided, load default config
 if args and args.config:
-    config = Config(args.config)
+    config_file = args.config
 else:
-    config = Config('config.ini')
+    config_file = 'config.ini'
+
+devices = []
+for spec in args.device or ['']:
+    serial, _, device_config_file = spec.partition('=')
+    device = Device(serial) if serial else Device.default
+    devices.append(
+        (device, Config(device_config_file or config_file)))
+
+if args.replay:
+    # Every device replays its own copy of the recording. They share one
+    # virtual clock with the scheduler, which runs on the default device
+    clock = VirtualClock()
+    Device.default.clock = clock
+    for device, config in devices:
+        # Virtual timers must not leak into the state of live runs, and a
+        # replay must not depend on the state a previous run left behind
+        config.state['file'] = None
+        device.bind(Adb.use_device)(FakeDevice(args.replay, clock))
+        device.clock = clock
+    random.seed(0)
+else:
+    Adb.init()
+# Templates and matching settings are shared by every device
+Utils.init(devices[0][1])
+Metrics.init(devices[0][1])
+
+scheduler = Scheduler()
+
+
+def start(device, config):
+    """Sets up the device and schedules its modules. Runs with the device
+    active, so per-device state such as the state file is named after it.
+
+    Args:
+        device (Device): Device to drive.
+        config (Config): azurlane-auto Config instance of the device.
+    """
+    Utils.init_device(config)
+    ALAuto(config).schedule(scheduler, device)
 
-script = ALAuto(config)
-Adb.init()
 
-while True:
-    script.run_test()
-    script.run_commission_cycle()
-    script.run_combat_cycle()
-    script.run_mission_cycle()
-    script.print_cycle_stats()
+for device, config in devices:
+    device.bind(start)(device, config)
+scheduler.run(args.workers or len(devices))
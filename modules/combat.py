@@ -1,24 +1,71 @@
 from datetime import datetime, timedelta
-from threading import Thread
 from util.logger import Logger
+from util.metrics import Metrics
+from util.nav import Nav
+from util.scene import Scene
+from util.screen import MotionEstimator
+from util.spatial import EnemyIndex, MapModel
 from util.utils import Region, Utils
 
 
+class Morale(object):
+
+    HAPPY = 'happy'
+    NEUTRAL = 'neutral'
+    SAD = 'sad'
+    STATES = [HAPPY, NEUTRAL, SAD]
+
+    def __init__(self, fleets, confidence):
+        """Initializes a Morale, the result of one morale check.
+
+        Args:
+            fleets (list): list of (state, confidence) tuples, one per fleet
+                shown with a morale icon, in order from the top of the screen.
+            confidence (float): Confidence that no other morale icon is
+                shown.
+        """
+        self.fleets = fleets
+        self.state = max([state for state, _ in fleets] or [self.HAPPY],
+                         key=self.STATES.index)
+        self.confidence = min(
+            [score for state, score in fleets if state == self.state] +
+            [confidence])
+
+    def __repr__(self):
+        """Returns a description of the morale for log messages.
+
+        Returns:
+            string: the overall state, its confidence and the fleet states
+        """
+        return '{} ({:.2f}), fleets: {}'.format(
+            self.state, self.confidence,
+            [state for state, _ in self.fleets] or 'no morale icons')
+
+
 class CombatModule(object):
 
-    def __init__(self, config, stats):
+    MORALE_SIMILARITY = 0.95
+    MORALE_FLOOR = 0.7
+    RECOVERY_ATTEMPTS = 3
+
+    def __init__(self, config, stats, store=None):
         """Initializes the Combat module.
 
         Args:
             config (Config): ALAuto Config instance.
             stats (Stats): ALAuto Stats instance.
+            store (StateStore, optional): ALAuto StateStore instance, which
+                is checkpointed as the sortie progresses.
         """
         self.enabled = True
         self.config = config
         self.stats = stats
-        self.morale = {}
-        self.next_combat_time = datetime.now()
+        self.store = store
+        self.morale = None
+        self.next_combat_time = Utils.now()
         self.resume_previous_sortie = False
+        self.in_sortie = False
+        self.need_to_recover = False
         self.kills_needed = 0
         self.combat_auto_enabled = False
         self.hard_mode = self.config.combat['hard_mode']
@@ -26,9 +73,9 @@ class CombatModule(object):
         self.event_map = self.sortie_map.split('-')[0] == 'E'
         self.need_to_refocus = True
         self.avoided_ambush = True
+        self.map = MapModel()
+        self.last_scan = None
         self.region = {
-            'nav_back': Region(12, 8, 45, 30),
-            'home_menu_attack': Region(1000, 365, 180, 60),
             'event_map': Region(1145, 140, 70, 40),
             'map_go_1': Region(875, 465, 115, 35),
             'map_go_2': Region(925, 485, 170, 45),
@@ -45,9 +92,19 @@ class CombatModule(object):
             bool: True if the combat cycle was complete
         """
         if self.check_need_to_sortie():
-            Logger.log_msg('Navigating to map.')
-            Utils.touch_randomly(self.region['home_menu_attack'])
-            Utils.script_sleep(1)
+            if self.need_to_recover and not self.return_home():
+                return False
+            start = Utils.now()
+            if (self.in_sortie and self.resume_previous_sortie and
+                    Scene.classify() != Scene.HOME):
+                Logger.log_msg('Resuming sortie in progress.')
+            else:
+                Logger.log_msg('Navigating to map.')
+                if not Nav.navigate_to(Scene.MAP):
+                    self.need_to_recover = True
+                    self.set_next_combat_time({'seconds': 10})
+                    return False
+            self.map.reset()
             if not self.resume_previous_sortie:
                 self.kills_needed = self.config.combat['kills_needed']
                 if self.event_map:
@@ -60,10 +117,13 @@ class CombatModule(object):
                 Utils.script_sleep()
                 Utils.touch_randomly(self.region['map_go_2'])
                 Utils.script_sleep(5)
+                self.in_sortie = True
+                self.checkpoint()
                 if self.config.combat['alt_clear_fleet']:
                     Logger.log_msg('Alternate clearing fleet enabled, ' +
                                    'switching to 2nd fleet to clear trash')
                     self.switch_fleet()
+                    self.map.reset()
                     self.need_to_refocus = False
             # Trash
             if self.clear_trash():
@@ -71,16 +131,81 @@ class CombatModule(object):
                 if self.config.combat['boss_fleet']:
                     Logger.log_msg('Switching to 2nd fleet to kill boss')
                     self.switch_fleet()
+                    self.map.reset()
                 self.clear_boss()
                 self.stats.increment_combat_done()
-                self.next_combat_time = datetime.now()
+                self.in_sortie = False
+                Metrics.observe('sortie_seconds', (
+                    Utils.now() - start).total_seconds(), True)
+                self.next_combat_time = Utils.now()
                 Logger.log_success('Sortie complete. Navigating back home.')
-                while not (Utils.exists('home_menu_build')):
-                    Utils.touch_randomly(self.region['nav_back'])
+                self.return_home()
                 self.set_next_combat_time({'seconds': 10})
             return True
         return False
 
+    def return_home(self):
+        """Method to navigate back to the home screen, trying again from
+        wherever navigation got stuck. If the home screen cannot be reached,
+        the module is marked as needing recovery and the next combat cycle,
+        due shortly, returns home before doing anything else.
+
+        Returns:
+            bool: True if the home screen was reached, False otherwise
+        """
+        for _ in range(self.RECOVERY_ATTEMPTS):
+            if Nav.navigate_to(Scene.HOME):
+                self.need_to_recover = False
+                return True
+        Logger.log_error('Unable to return home, retrying next cycle.')
+        self.need_to_recover = True
+        self.set_next_combat_time({'seconds': 10})
+        return False
+
+    def get_state(self):
+        """Method to get the state of the module for checkpointing.
+
+        Returns:
+            dict: dict of the sortie progress, schedule and morale
+        """
+        return {
+            'map': self.sortie_map,
+            'in_sortie': self.in_sortie,
+            'kills_needed': self.kills_needed,
+            'next_combat_time': self.next_combat_time.isoformat(),
+            'morale': None if self.morale is None else {
+                'fleets': self.morale.fleets,
+                'confidence': self.morale.confidence
+            }
+        }
+
+    def set_state(self, state):
+        """Method to restore the checkpointed state of the module. A sortie
+        that was in progress is resumed instead of started over, unless the
+        configured map changed.
+
+        Args:
+            state (dict): dict of the sortie progress, schedule and morale
+        """
+        self.next_combat_time = datetime.fromisoformat(
+            state['next_combat_time'])
+        if state['morale'] is not None:
+            self.morale = Morale(
+                [tuple(fleet) for fleet in state['morale']['fleets']],
+                state['morale']['confidence'])
+        if state['in_sortie'] and state['map'] == self.sortie_map:
+            Logger.log_msg('Sortie in progress with {} kills needed.'
+                           .format(state['kills_needed']))
+            self.in_sortie = True
+            self.resume_previous_sortie = True
+            self.kills_needed = state['kills_needed']
+
+    def checkpoint(self):
+        """Method to checkpoint the state store, if there is one.
+        """
+        if self.store is not None:
+            self.store.checkpoint()
+
     def check_need_to_sortie(self):
         """Method to check whether the combat fleets need to sortie based on
         the stored next combat time.
@@ -90,7 +215,7 @@ class CombatModule(object):
         """
         if not self.enabled:
             return False
-        if self.next_combat_time < datetime.now():
+        if self.next_combat_time <= Utils.now():
             return True
         return False
 
@@ -102,7 +227,7 @@ class CombatModule(object):
             delta (dict, optional): Dict containing the hours, minutes, and
                 seconds delta.
         """
-        self.next_combat_time = datetime.now() + timedelta(
+        self.next_combat_time = Utils.now() + timedelta(
             hours=delta['hours'] if 'hours' in delta else 0,
             minutes=delta['minutes'] if 'minutes' in delta else 0,
             seconds=delta['seconds'] if 'seconds' in delta else 0)
@@ -127,10 +252,12 @@ class CombatModule(object):
         """Method to get the enemy closest to the fleet's current location. Note
         this will not always be the enemy that is actually closest due to the
         asset used to find enemies and when enemies are obstructed by terrain
-        or the second fleet
+        or the second fleet. Enemies are remembered on the map model for the
+        whole sortie, so the screen is only swiped around when no enemy is
+        known, and a remembered enemy off the screen is swiped into view.
 
         Args:
-            blacklist(array, optional): Defaults to []. An array of
+            blacklist(array, optional): Defaults to []. An array of map
             coordinates to exclude when searching for the closest enemy
 
         Returns:
@@ -140,50 +267,134 @@ class CombatModule(object):
         x_dist = 125
         y_dist = 175
         swipes = [['n', 1.0], ['e', 1.0], ['s', 1.5], ['w', 1.5]]
-        closest = None
-        while closest is None:
-            if self.need_to_refocus:
-                self.refocus_fleet()
-            current_location = self.get_fleet_location()
+        while True:
+            self.register_map()
+            self.scan_map()
             for swipe in swipes:
-                enemies = Utils.find_all('combat_enemy_fleet', 0.88)
-                if enemies:
-                    for coord in blacklist:
-                        enemies.remove(coord)
+                closest = self.closest_known_enemy(blacklist)
+                if closest is not None:
                     Logger.log_msg('Current location is: {}'
-                                   .format(current_location))
-                    Logger.log_msg('Enemies found at: {}'.format(enemies))
-                    closest = enemies[Utils.find_closest(
-                                      enemies, current_location)[1]]
+                                   .format(self.map.to_screen(self.map.fleet)))
+                    Logger.log_msg('Enemies known at: {}'.format(
+                        [self.map.to_screen(enemy)
+                         for enemy in self.map.enemies]))
+                    closest = self.map.to_screen(closest)
                     Logger.log_msg('Closest enemy is at {}'.format(closest))
                     return [closest[0], closest[1] - 10]
-                else:
-                    direction, multiplier = swipe[0], swipe[1]
-                    if direction == 'n':
-                        current_location[1] = (
-                            current_location[1] + (2 * y_dist * multiplier))
-                        Utils.swipe(640, 360 - y_dist * multiplier,
-                                    640, 360 + y_dist * multiplier, 250)
-                    elif direction == 's':
-                        current_location[1] = (
-                            current_location[1] - (2 * y_dist * multiplier))
-                        Utils.swipe(640, 360 + y_dist * multiplier,
-                                    640, 360 - y_dist * multiplier, 250)
-                    elif direction == 'e':
-                        current_location[0] = (
-                            current_location[0] + (2 * x_dist * multiplier))
-                        Utils.swipe(640 + x_dist * multiplier, 360,
-                                    640 - x_dist * multiplier, 360, 250)
-                    elif direction == 'w':
-                        current_location[0] = (
-                            current_location[0] - (2 * x_dist * multiplier))
-                        Utils.swipe(640 - x_dist * multiplier, 360,
-                                    640 + x_dist * multiplier, 360, 250)
-                self.need_to_refocus = True
+                direction, multiplier = swipe[0], swipe[1]
+                if direction == 'n':
+                    self.swipe_map(640, 360 - y_dist * multiplier,
+                                   640, 360 + y_dist * multiplier)
+                elif direction == 's':
+                    self.swipe_map(640, 360 + y_dist * multiplier,
+                                   640, 360 - y_dist * multiplier)
+                elif direction == 'e':
+                    self.swipe_map(640 + x_dist * multiplier, 360,
+                                   640 - x_dist * multiplier, 360)
+                elif direction == 'w':
+                    self.swipe_map(640 - x_dist * multiplier, 360,
+                                   640 + x_dist * multiplier, 360)
+            self.need_to_refocus = True
             x_dist *= 1.5
             y_dist *= 1.5
+
+    def closest_known_enemy(self, blacklist=[]):
+        """Method to get the remembered enemy closest to the fleet, swiping
+        it into view if it is off the screen. Remembered locations drift a
+        little between battles, so the screen is scanned again after swiping
+        and the enemy picked again from what is actually there.
+
+        Args:
+            blacklist(array, optional): Defaults to []. An array of map
+            coordinates to exclude when searching for the closest enemy
+
+        Returns:
+            array: An array containing the x and y map coordinates of the
+            closest enemy, or None if no enemy on the screen is known
+        """
+        for _ in range(3):
+            closest = self.map.closest_enemy(self.map.fleet, blacklist)
+            if closest is None or self.map.visible(closest, 100):
+                return closest
+            self.focus_map(closest, 100)
         return None
 
+    def register_map(self):
+        """Method to refocus on the fleet if needed and anchor the map model
+        to its location, so remembered coordinates line up with the screen.
+        """
+        if self.need_to_refocus or not self.map.registered:
+            self.refocus_fleet()
+            self.map.anchor_fleet(self.get_fleet_location())
+            self.need_to_refocus = False
+            self.last_scan = None
+
+    def scan_map(self, screen=None):
+        """Method to record the enemies and boss on the screen on the map
+        model.
+
+        Args:
+            screen (image, optional): Defaults to a new capture. A CV2 image
+                object containing the screen.
+        """
+        screen = Utils.update_screen() if screen is None else screen
+        enemies = Utils.match_all(screen, 'combat_enemy_fleet', 0.88)
+        boss = Utils.match(screen, 'combat_enemy_boss_alt', 0.8)
+        bosses = [] if boss is None else [(boss.x, boss.y)]
+        self.map.observe(enemies, bosses[0] if bosses else None)
+        self.last_scan = (screen, enemies, bosses)
+
+    def swipe_map(self, x1, y1, x2, y2):
+        """Method to swipe the map, move the map model along with it and
+        record what is on the screen afterwards. The movement is estimated
+        from the screens before and after the swipe, which also catches
+        swipes stopped by the edge of the map; the enemies and boss seen
+        before are moved by it and only the revealed part of the screen is
+        searched.
+
+        Args:
+            x1 (int): x-coordinate to begin the swipe at.
+            y1 (int): y-coordinate to begin the swipe at.
+            x2 (int): x-coordinate to end the swipe at.
+            y2 (int): y-coordinate to end the swipe at.
+        """
+        Utils.swipe(x1, y1, x2, y2, 250)
+        screen = Utils.update_screen()
+        offset = None
+        if self.last_scan is not None:
+            previous, enemies, bosses = self.last_scan
+            offset = MotionEstimator.offset(
+                previous, screen, (x2 - x1, y2 - y1))
+        if offset is None:
+            self.map.pan(x2 - x1, y2 - y1)
+            self.scan_map(screen)
+            return
+        self.map.pan(*offset)
+        enemies = Utils.match_all_moved(
+            screen, 'combat_enemy_fleet', enemies, offset, 0.88)
+        bosses = Utils.match_all_moved(
+            screen, 'combat_enemy_boss_alt', bosses, offset, 0.8)[:1]
+        self.map.observe(enemies, bosses[0] if bosses else None)
+        self.last_scan = (screen, enemies, bosses)
+
+    def focus_map(self, coord, margin):
+        """Method to swipe the map until the map coordinates are on the
+        screen, at least margin pixels from its edges. Gives up after a few
+        swipes, e.g. when the edge of the map stops the screen from moving.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+            margin (int): Distance in pixels from the edges of the screen.
+        """
+        for _ in range(5):
+            if self.map.visible(coord, margin):
+                return
+            x, y = self.map.to_screen(coord)
+            x_dist = max(-500, min(500, 640 - x)) / 2
+            y_dist = max(-250, min(250, 360 - y)) / 2
+            self.swipe_map(640 - x_dist, 360 - y_dist,
+                           640 + x_dist, 360 + y_dist)
+
     def conduct_prebattle_check(self):
         """Method to check morale and check if auto-battle is enabled before a
         sortie. Enables autobattle if not already enabled.
@@ -192,11 +403,11 @@ class CombatModule(object):
             bool: True if it is ok to proceed with the battle
         """
         ok = True
-        fleet_morale = self.check_morale()
-        if fleet_morale['sad']:
+        morale = self.check_morale()
+        if morale.state == Morale.SAD:
             self.set_next_combat_time({'hours': 2})
             ok = False
-        elif fleet_morale['neutral']:
+        elif morale.state == Morale.NEUTRAL:
             self.set_next_combat_time({'hours': 1})
             ok = False
         else:
@@ -216,18 +427,27 @@ class CombatModule(object):
         battle is complete.
         """
         Logger.log_msg('Starting battle')
+        start = Utils.now()
         while (Utils.exists('combat_auto_enabled')):
             Utils.touch_randomly(self.region['battle_start'])
             if Utils.wait_for_exist('combat_notification_sort', 3):
                 return False
         Utils.script_sleep(30)
-        while not Utils.find_and_touch('combat_battle_confirm', 0.85):
-            if Utils.find_and_touch('confirm'):
+        while True:
+            hits = Utils.detect_any(Utils.update_screen(), [
+                ('combat_battle_confirm', 0.85), 'confirm'])
+            if 'combat_battle_confirm' in hits:
+                Utils.touch_randomly(hits['combat_battle_confirm'])
+                break
+            if 'confirm' in hits:
+                Utils.touch_randomly(hits['confirm'])
                 Logger.log_msg('Locked new ship.')
             else:
                 Utils.touch_randomly(Region(0, 100, 150, 150))
                 Utils.script_sleep()
         Logger.log_msg('Battle complete.')
+        Metrics.observe('battle_seconds', (
+            Utils.now() - start).total_seconds(), True)
         if Utils.wait_and_touch('confirm', 3):
             Logger.log_msg('Dismissing urgent notification.')
         return True
@@ -239,41 +459,63 @@ class CombatModule(object):
         while self.kills_needed > 0:
             blacklist = []
             tries = 0
+            target = None
             if self.resume_previous_sortie:
                 self.resume_previous_sortie = False
                 Utils.find_and_touch('combat_attack')
                 Utils.script_sleep(2)
             else:
                 self.avoided_ambush = True
-            while not Utils.exists('combat_battle_start'):
-                if Utils.find_and_touch('combat_evade'):
+            while True:
+                # The map view changes after every move, so the scene
+                # fingerprints rarely match here; the three screens that
+                # can follow a move are checked directly instead
+                hits = Utils.detect_any(Utils.update_screen(), [
+                    'combat_battle_start', 'combat_evade',
+                    'combat_items_received'], parallel=True)
+                if 'combat_battle_start' in hits:
+                    break
+                if 'combat_evade' in hits:
+                    Utils.touch_randomly(hits['combat_evade'])
                     if Utils.wait_for_exist('combat_battle_start', 3):
                         self.avoided_ambush = False
                     else:
                         Logger.log_msg('Successfully avoided ambush.')
-                elif Utils.find_and_touch('combat_items_received'):
-                    pass
+                elif 'combat_items_received' in hits:
+                    Utils.touch_randomly(hits['combat_items_received'])
                 else:
+                    if tries:
+                        # The fleet moved without reaching a battle, so its
+                        # location on the map is no longer known
+                        self.map.reset()
                     enemy_coord = self.get_closest_enemy()
                     if tries > 2:
-                        blacklist.append(enemy_coord)
+                        blacklist.append(self.map.to_map(
+                            [enemy_coord[0], enemy_coord[1] + 10]))
                         enemy_coord = self.get_closest_enemy(blacklist)
                     Logger.log_msg('Navigating to enemy fleet at {}'
                                    .format(enemy_coord))
+                    target = self.map.to_map(
+                        [enemy_coord[0], enemy_coord[1] + 10])
                     Utils.touch(enemy_coord)
                     tries += 1
                     Utils.script_sleep(5)
+            if self.avoided_ambush and target is not None:
+                self.map.move_fleet(target)
+                self.map.remove_enemy(target)
+            else:
+                self.map.reset()
             if self.conduct_prebattle_check():
                 if self.conduct_battle():
                     self.need_to_refocus = True
                 else:
                     self.resume_previous_sortie = True
-                    while not (Utils.exists('home_menu_build')):
-                        Utils.touch_randomly(self.region['nav_back'])
+                    self.return_home()
                     # Add logic for retirement here?
                     return False
             if self.avoided_ambush:
                 self.kills_needed -= 1
+                self.checkpoint()
             Logger.log_msg('Kills left for boss to spawn: {}'
                            .format(self.kills_needed))
         Utils.script_sleep(1)
@@ -285,14 +527,21 @@ class CombatModule(object):
         while not Utils.exists('combat_battle_start'):
             boss = None
             similarity = 0.8
-            while boss is None:
-                boss = Utils.scroll_find(
-                    'combat_enemy_boss_alt', 250, 175, similarity)
-                similarity -= 0.015
-            Logger.log_msg('Boss found at: {}'.format([boss.x, boss.y]))
-            Logger.log_msg('Focusing on boss')
-            Utils.swipe(boss.x, boss.y, 640, 360, 250)
-            boss = None
+            if self.map.boss is not None:
+                self.register_map()
+                Logger.log_msg('Boss known at: {}'.format(
+                    self.map.to_screen(self.map.boss)))
+                Logger.log_msg('Focusing on boss')
+                self.focus_map(self.map.boss, 150)
+            else:
+                while boss is None:
+                    boss = Utils.scroll_find(
+                        'combat_enemy_boss_alt', 250, 175, similarity)
+                    similarity -= 0.015
+                Logger.log_msg('Boss found at: {}'.format([boss.x, boss.y]))
+                Logger.log_msg('Focusing on boss')
+                Utils.swipe(boss.x, boss.y, 640, 360, 250)
+                boss = None
             while boss is None:
                 boss = Utils.find('combat_enemy_boss_alt', similarity)
                 similarity -= 0.015
@@ -300,25 +549,31 @@ class CombatModule(object):
             # the boss is obstructed by another fleet or enemy
             boss_coords = [boss.x + 50, boss.y - 15]
             Utils.touch(boss_coords)
+            self.map.reset()
             if Utils.wait_for_exist('combat_unable', 3):
                 boss = Utils.scroll_find('combat_enemy_boss_alt',
                                          250, 175, 0.75)
-                enemies = Utils.find_all('combat_enemy_fleet', 0.89)
-                enemies.remove(boss)
-                closest_to_boss = enemies[Utils.find_closest(enemies, boss)[1]]
-                Utils.find_and_touch(closest_to_boss)
+                enemies = EnemyIndex(
+                    Utils.find_all('combat_enemy_fleet', 0.89))
+                enemies.blacklist([boss.x, boss.y], max(boss.w, boss.h))
+                closest_to_boss = enemies.nearest([boss.x, boss.y])
+                if closest_to_boss:
+                    Utils.touch(closest_to_boss[0])
                 if Utils.wait_for_exist('combat_unable', 3):
-                    Utils.find_and_touch(self.get_closest_enemy())
+                    Utils.touch(self.get_closest_enemy())
                     if Utils.wait_for_exist('combat_battle_start', 3):
                         self.conduct_battle()
             else:
                 Utils.script_sleep(5)
-                if Utils.find_and_touch('combat_evade'):
+                hits = Utils.detect_any(Utils.update_screen(), [
+                    'combat_evade', 'combat_items_received'])
+                if 'combat_evade' in hits:
+                    Utils.touch_randomly(hits['combat_evade'])
                     if Utils.wait_for_exist('combat_battle_start', 3):
                         self.conduct_battle()
                         self.refocus_fleet()
-                elif Utils.find_and_touch('combat_items_received'):
-                    pass
+                elif 'combat_items_received' in hits:
+                    Utils.touch_randomly(hits['combat_items_received'])
         if self.conduct_prebattle_check():
             self.conduct_battle()
 
@@ -336,26 +591,33 @@ class CombatModule(object):
         self.switch_fleet()
 
     def check_morale(self):
-        """Method to multithread the detection of morale states of the fleet.
+        """Method to detect the morale of the fleets from one capture of the
+        screen. Every morale icon is matched at once; each icon found is one
+        fleet, and icons of different states found at the same spot are
+        resolved in favor of the better match.
 
         Returns:
-            dict: dict of bools of the different morale states
+            Morale: the morale of the fleets
         """
-        thread_check_neutral_morale = Thread(
-            target=self.check_morale_func, args=('neutral',))
-        thread_check_sad_morale = Thread(
-            target=self.check_morale_func, args=('sad',))
-        Utils.multithreader([
-            thread_check_neutral_morale, thread_check_sad_morale])
+        images = {'morale_{}'.format(state): state
+                  for state in [Morale.NEUTRAL, Morale.SAD]}
+        candidates = []
+        for image, peaks in Utils.match_all_many(
+                Utils.update_screen(), list(images), self.MORALE_FLOOR,
+                scores=True).items():
+            candidates += [(score, x, y, images[image])
+                           for x, y, score in peaks]
+        icons, misses = [], [0]
+        for score, x, y, state in sorted(candidates, reverse=True):
+            if any(abs(x - ix) <= 10 and abs(y - iy) <= 10
+                   for _, ix, iy, _ in icons):
+                continue
+            if score >= self.MORALE_SIMILARITY:
+                icons.append((score, x, y, state))
+            else:
+                misses.append(score)
+        self.morale = Morale(
+            [(state, score) for score, _, _, state
+             in sorted(icons, key=lambda icon: icon[2])], 1 - max(misses))
+        Logger.log_msg('Morale: {}'.format(self.morale))
         return self.morale
-
-    def check_morale_func(self, status):
-        """Child multithreaded method for checking morale states.
-
-        Args:
-            status (string): which morale status to check for
-        """
-        self.morale[status] = (
-            True
-            if (Utils.exists('morale_{}'.format(status)))
-            else False)
@@ -1,4 +1,5 @@
-from util.utils import Utils
+from util.logger import Logger
+from util.utils import Utils, Region
 
 
 class CommissionModule(object):
@@ -18,14 +19,20 @@ class CommissionModule(object):
         if (Utils.find_and_touch('notification_commission_complete')):
             Logger.log_msg('Completed commissions found.' +
                            'Opening commission panel.')
-            while Utils.find_and_touch('commission_complete'):
+            while True:
+                hits = Utils.detect_any(Utils.update_screen(), [
+                    'commission_complete', 'commission_go'])
+                if 'commission_complete' not in hits:
+                    break
+                Utils.touch_randomly(hits['commission_complete'])
                 Logger.log_msg('Completed commission found.' +
                                'Redeeming reward.')
                 Utils.touch_randomly()
                 Utils.script_sleep(1)
                 Utils.touch_randomly()
                 Utils.script_sleep(1)
-            if Utils.find_and_touch('commission_go'):
+            if 'commission_go' in hits:
+                Utils.touch_randomly(hits['commission_go'])
                 # Ensure the list is scrolled up to the top before
                 # checking in progress commissions
                 Utils.swipe(190, 190, 75, 650)
@@ -1,4 +1,6 @@
 from util.logger import Logger
+from util.nav import Nav
+from util.scene import Scene
 from util.utils import Utils, Region
 
 
@@ -22,8 +24,11 @@ class RetirementModule(object):
         the entire action filtering and retiring ships
         """
         if self.need_to_retire:
-            while not (Utils.find_and_touch('home_menu_build')):
-                Utils.touch_randomly(Region(12, 8, 45, 30))
+            if not Nav.navigate_to(Scene.HOME):
+                return
+            if not Utils.wait_and_touch('home_menu_build', 5):
+                Logger.log_error('Unable to open the build menu.')
+                return
             Utils.wait_and_touch('build_menu_retire', 5)
             Utils.script_sleep(1)
             self.set_filters()
@@ -42,11 +47,10 @@ class RetirementModule(object):
         """
         Logger.log_msg('Selecting ships for retirement.')
         x, y = 90, 180
-        for i in range(0, 7):
-            Utils.touch_randomly(Region(x + (i * 170), y, 30, 15))
+        regions = [Region(x + (i * 170), y, 30, 15) for i in range(0, 7)]
         y = 412
-        for i in range(0, 3):
-            Utils.touch_randomly(Region(x + (i * 170), y, 30, 15))
+        regions += [Region(x + (i * 170), y, 30, 15) for i in range(0, 3)]
+        Utils.touch_many(regions)
 
     def retire_ships(self):
         """Clicks through the dialogs for retiring ships
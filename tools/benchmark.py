@@ -0,0 +1,333 @@
+"""Benchmarks the vision hot path over a directory of recorded 1280x720
+screenshots and every template in assets/, timing capture decoding,
+template loading and matching as separate stages.
+
+Usage: python -m tools.benchmark FRAMES_DIR [-o OUTPUT_JSON] [-s STAGE ...]
+                                 [--live] [--input-mode MODE]
+                                 [--match-workers N]
+
+The tap stages send input to a FakeDevice unless --live is passed, in which
+case they tap the top-left corner of the connected device's screen.
+"""
+import argparse
+import cv2
+import glob
+import json
+import numpy
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from util.adb import Adb
+from util.device import Device
+from util.fake_device import FakeDevice
+from util.logger import Logger
+from util.matching import Matcher, SpectrumMatcher
+from util.templates import Templates
+from util.touchscreen import Touchscreen
+from util.utils import Utils
+
+
+class Benchmark(object):
+
+    TAPS = 10
+    ENEMIES = ['combat_enemy_fleet', 'combat_enemy_boss_alt',
+               'combat_enemy_small', 'combat_enemy_medium',
+               'combat_enemy_large']
+
+    def __init__(self, frames_dir, live=False):
+        """Initializes the Benchmark by loading the frame corpus and the
+        templates.
+
+        Args:
+            frames_dir (string): Directory of recorded PNG screenshots.
+            live (bool, optional): Defaults to False. Whether to send the tap
+                stages to the connected device instead of a FakeDevice.
+        """
+        self.frames_dir = frames_dir
+        self.live = live
+        self.paths = sorted(glob.glob(os.path.join(frames_dir, '*.png')))
+        self.frames = [cv2.imread(path, 0) for path in self.paths]
+        Templates.load_all()
+        self.templates = sorted(Templates.images)
+        self.results = {}
+        self.stages = {
+            'decode_png': self.bench_decode_png,
+            'decode_raw': self.bench_decode_raw,
+            'template_load': self.bench_template_load,
+            'template_cache': self.bench_template_cache,
+            'update_screen_png': lambda: self.bench_update_screen('png'),
+            'update_screen_raw': lambda: self.bench_update_screen('raw'),
+            'find': lambda: self.bench_find(False),
+            'find_pyramid': lambda: self.bench_find(True),
+            'find_all': self.bench_find_all,
+            'filter_similar_coords': self.bench_filter_similar_coords,
+            'detect': lambda: self.bench_detect(False),
+            'detect_parallel': lambda: self.bench_detect(True),
+            'find_enemies': lambda: self.bench_find_enemies(False),
+            'find_enemies_parallel': lambda: self.bench_find_enemies(True),
+            'find_enemies_spectrum': self.bench_find_enemies_spectrum,
+            'tap': self.bench_tap,
+            'tap_batch': self.bench_tap_batch
+        }
+
+    def run(self, stages=None):
+        """Runs the specified stages, or every stage if none are specified.
+
+        Args:
+            stages (list, optional): Defaults to None. Names of the stages.
+
+        Returns:
+            dict: the report of the run
+        """
+        Utils.search_regions = False
+        Utils.spectrum_matching = False
+        for name in stages or self.stages:
+            Logger.log_msg('Running stage {}.'.format(name))
+            tracemalloc.start()
+            durations = self.stages[name]()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.results[name] = self.summarize(durations, peak)
+        return self.report()
+
+    def time_calls(self, func, args_list):
+        """Times func once per set of arguments.
+
+        Args:
+            func (function): Function to time.
+            args_list (list): List of argument tuples to call func with.
+
+        Returns:
+            list: list of durations in seconds
+        """
+        durations = []
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    def bench_decode_png(self):
+        """Times decoding the PNG screencap of every frame.
+        """
+        data = [(numpy.frombuffer(cv2.imencode('.png', frame)[1],
+                                  numpy.uint8), 0) for frame in self.frames]
+        return self.time_calls(cv2.imdecode, data)
+
+    def bench_decode_raw(self):
+        """Times parsing the raw screencap of every frame.
+        """
+        data = [(self.raw_screencap(frame),) for frame in self.frames]
+        return self.time_calls(Utils.decode_raw_screencap, data)
+
+    def bench_template_load(self):
+        """Times reading every template from disk.
+        """
+        paths = [(os.path.join(Templates.ASSET_DIR, '{}.png'.format(name)), 0)
+                 for name in self.templates]
+        return self.time_calls(cv2.imread, paths)
+
+    def bench_template_cache(self):
+        """Times looking up every template in the cache.
+        """
+        return self.time_calls(
+            Templates.get, [(name,) for name in self.templates])
+
+    def bench_update_screen(self, mode):
+        """Times capturing every frame from a FakeDevice in the capture mode.
+        """
+        Adb.use_device(FakeDevice(self.frames_dir))
+        Device.current().capture_mode = mode
+        try:
+            return self.time_calls(
+                Utils.update_screen, [()] * len(self.frames))
+        finally:
+            Adb.use_device(None)
+
+    def bench_find(self, pyramid):
+        """Times finding every template on every frame.
+        """
+        return self.time_calls(Utils.match, [
+            (frame, name, Utils.DEFAULT_SIMILARITY, pyramid)
+            for frame in self.frames for name in self.templates])
+
+    def bench_find_all(self):
+        """Times finding all locations of every template on every frame.
+        """
+        return self.time_calls(Utils.match_all, [
+            (frame, name, 0.88)
+            for frame in self.frames for name in self.templates])
+
+    def bench_detect(self, parallel):
+        """Times detecting every template on every frame in one pass.
+        """
+        return self.time_calls(Utils.detect_all, [
+            (frame, self.templates, Utils.DEFAULT_SIMILARITY, parallel)
+            for frame in self.frames])
+
+    def bench_find_enemies(self, parallel):
+        """Times finding all locations of every enemy template on every frame
+        in one pass.
+        """
+        if parallel:
+            return self.time_calls(Utils.match_all_many, [
+                (frame, self.ENEMIES, 0.88) for frame in self.frames])
+        return self.time_calls(
+            lambda frame: [Utils.match_all(frame, name, 0.88)
+                           for name in self.ENEMIES],
+            [(frame,) for frame in self.frames])
+
+    def bench_find_enemies_spectrum(self):
+        """Times finding all locations of every enemy template on every frame
+        against one Fourier transform of the frame, to compare with
+        find_enemies, which runs matchTemplate once per template.
+        """
+        templates = [(name, Templates.get(name)) for name in self.ENEMIES]
+
+        def find(frame):
+            matcher = SpectrumMatcher(frame)
+            return [Matcher.peaks(matcher.response(template, name), 0.88)
+                    for name, template in templates]
+
+        return self.time_calls(find, [(frame,) for frame in self.frames])
+
+    def bench_filter_similar_coords(self):
+        """Times filtering dense enemy candidate lists.
+        """
+        # Dense candidate lists like the raw above-threshold pixels that
+        # find_all used to hand to filter_similar_coords
+        coords = []
+        for frame in self.frames:
+            match = cv2.matchTemplate(
+                frame, Templates.get('combat_enemy_fleet'),
+                cv2.TM_CCOEFF_NORMED)
+            ys, xs = numpy.nonzero(match >= 0.7)
+            coords.append((list(zip(xs, ys)),))
+        return self.time_calls(Utils.filter_similar_coords, coords)
+
+    def bench_tap(self):
+        """Times sending TAPS taps one command at a time, per tap.
+        """
+        return [duration / self.TAPS for duration in self.time_inputs(
+            lambda: [Touchscreen.send(Touchscreen.tap(0, 0))
+                     for _ in range(self.TAPS)])]
+
+    def bench_tap_batch(self):
+        """Times sending TAPS taps as one batch, per tap.
+        """
+        return [duration / self.TAPS for duration in self.time_inputs(
+            lambda: Touchscreen.send(
+                sum([Touchscreen.tap(0, 0) for _ in range(self.TAPS)], [])))]
+
+    def time_inputs(self, func):
+        """Times func once per frame against the live device or a FakeDevice.
+
+        Args:
+            func (function): Function sending the input.
+
+        Returns:
+            list: list of durations in seconds
+        """
+        if not self.live:
+            Adb.use_device(FakeDevice(self.frames_dir))
+        try:
+            return self.time_calls(func, [()] * len(self.frames))
+        finally:
+            Adb.use_device(None)
+
+    @staticmethod
+    def raw_screencap(frame):
+        """Converts a frame to the raw output of screencap.
+
+        Args:
+            frame (image): A grayscale CV2 image object.
+
+        Returns:
+            bytes: the raw screencap dump of the frame
+        """
+        return FakeDevice.raw_screencap(
+            cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+
+    @staticmethod
+    def summarize(durations, peak):
+        """Summarizes the durations of a stage.
+
+        Args:
+            durations (list): list of durations in seconds.
+            peak (int): Peak traced memory of the stage in bytes.
+
+        Returns:
+            dict: the latency percentiles, throughput and peak memory
+        """
+        if not durations:
+            return {'calls': 0}
+        ms = numpy.array(durations) * 1000
+        return {
+            'calls': len(durations),
+            'p50_ms': round(float(numpy.percentile(ms, 50)), 3),
+            'p95_ms': round(float(numpy.percentile(ms, 95)), 3),
+            'p99_ms': round(float(numpy.percentile(ms, 99)), 3),
+            'mean_ms': round(float(ms.mean()), 3),
+            'per_second': round(1000 / float(ms.mean()), 2),
+            'peak_memory_bytes': peak
+        }
+
+    def report(self):
+        """Builds the report of the run.
+
+        Returns:
+            dict: the report of the run
+        """
+        try:
+            commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'date': datetime.now().isoformat(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'frames': len(self.frames),
+            'templates': len(self.templates),
+            'max_rss_kb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss,
+            'stages': self.results
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('frames', metavar='FRAMES_DIR',
+                        help='Directory of recorded PNG screenshots')
+    parser.add_argument('-o', '--output', metavar='OUTPUT_JSON',
+                        help='Write the results to the specified file')
+    parser.add_argument('-s', '--stages', nargs='+',
+                        help='Stages to run instead of every stage')
+    parser.add_argument('--live', action='store_true',
+                        help='Send the tap stages to the connected device')
+    parser.add_argument('--input-mode', choices=Touchscreen.MODES,
+                        default='input', help='How taps are injected')
+    parser.add_argument('--match-workers', type=int, default=0,
+                        help='Workers of the parallel stages (0 for one ' +
+                             'per core)')
+    args = parser.parse_args()
+
+    Touchscreen.configure(args.input_mode)
+    Utils.match_workers = args.match_workers
+    report = Benchmark(args.frames, args.live).run(args.stages)
+    for name, result in report['stages'].items():
+        Logger.log_success(
+            '{:<24} p50 {:>9} ms  p95 {:>9} ms  p99 {:>9} ms  {:>9}/s'.format(
+                name, result.get('p50_ms'), result.get('p95_ms'),
+                result.get('p99_ms'), result.get('per_second')))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        Logger.log_msg('Results written to {}.'.format(args.output))
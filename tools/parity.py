@@ -0,0 +1,92 @@
+"""Checks that coarse-to-fine (pyramid) matching finds the same matches as the
+exhaustive search on a directory of recorded 1280x720 screenshots.
+
+Usage: python -m tools.parity FRAMES_DIR [-s SIMILARITY] [-t TEMPLATE ...]
+"""
+import argparse
+import cv2
+import glob
+import os
+from util.logger import Logger
+from util.templates import Templates
+from util.utils import Utils
+
+
+def same_region(a, b, tolerance=2):
+    """Checks whether two find results point at the same location.
+
+    Args:
+        a (Region): First result, or None.
+        b (Region): Second result, or None.
+        tolerance (int, optional): Defaults to 2. Pixel tolerance.
+
+    Returns:
+        bool: True if both are None or both are within tolerance
+    """
+    if a is None or b is None:
+        return a is b
+    return abs(a.x - b.x) <= tolerance and abs(a.y - b.y) <= tolerance
+
+
+def same_coords(a, b, tolerance=2):
+    """Checks whether two find_all results contain the same locations.
+
+    Args:
+        a (list): First list of coordinates.
+        b (list): Second list of coordinates.
+        tolerance (int, optional): Defaults to 2. Pixel tolerance.
+
+    Returns:
+        bool: True if every coordinate has a counterpart in the other list
+    """
+    def covered(coords, others):
+        return all(any(abs(x - ox) <= tolerance and abs(y - oy) <= tolerance
+                       for ox, oy in others) for x, y in coords)
+    return covered(a, b) and covered(b, a)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('frames', metavar='FRAMES_DIR',
+                    help='Directory of recorded PNG screenshots')
+parser.add_argument('-s', '--similarity', type=float,
+                    default=Utils.DEFAULT_SIMILARITY,
+                    help='Similarity to match at')
+parser.add_argument('-l', '--levels', type=int, default=Utils.pyramid_levels,
+                    help='Number of pyramid levels')
+parser.add_argument('-t', '--templates', nargs='+',
+                    help='Templates to check instead of every asset')
+args = parser.parse_args()
+
+Utils.search_regions = False
+Utils.pyramid_levels = args.levels
+Templates.load_all()
+templates = args.templates or sorted(Templates.images)
+frames = sorted(glob.glob(os.path.join(args.frames, '*.png')))
+
+checks, mismatches = 0, 0
+for path in frames:
+    frame = cv2.imread(path, 0)
+    for template in templates:
+        checks += 1
+        exhaustive = Utils.match(frame, template, args.similarity)
+        pyramid = Utils.match(frame, template, args.similarity, True)
+        if not same_region(exhaustive, pyramid):
+            mismatches += 1
+            Logger.log_warning('find mismatch: {} on {}'.format(
+                template, os.path.basename(path)))
+        checks += 1
+        exhaustive = Utils.match_all(frame, template, args.similarity)
+        pyramid = Utils.match_all(frame, template, args.similarity, True)
+        if not same_coords(exhaustive, pyramid):
+            mismatches += 1
+            Logger.log_warning(
+                'find_all mismatch: {} on {}: {} vs {} matches'.format(
+                    template, os.path.basename(path), len(exhaustive),
+                    len(pyramid)))
+
+if mismatches:
+    Logger.log_error('{} of {} checks differ across {} frames.'.format(
+        mismatches, checks, len(frames)))
+else:
+    Logger.log_success('All {} checks agree across {} frames.'.format(
+        checks, len(frames)))
@@ -1,49 +1,303 @@
-import subprocess
-
-
-class Adb(object):
-
-    @classmethod
-    def init(cls):
-        """Kills and starts a new ADB server
-        """
-        cls.kill_server()
-        cls.start_server()
-
-    @staticmethod
-    def start_server():
-        """Starts the ADB server
-        """
-        cmd = ['adb', 'start-server']
-        subprocess.call(cmd)
-
-    @staticmethod
-    def kill_server():
-        """Kills the ADB server
-        """
-        cmd = ['adb', 'kill-server']
-        subprocess.call(cmd)
-
-    @staticmethod
-    def exec_out(args):
-        """Executes the command via exec-out
-
-        Args:
-            args (string): Command to execute.
-
-        Returns:
-            tuple: A tuple containing stdoutdata and stderrdata
-        """
-        cmd = ['adb', 'exec-out'] + args.split(' ')
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        return process.communicate()[0]
-
-    @staticmethod
-    def shell(args):
-        """Executes the command via adb shell
-
-        Args:
-            args (string): Command to execute.
-        """
-        cmd = ['adb', 'shell'] + args.split(' ')
-        subprocess.call(cmd)
+import socket
+import subprocess
+import time
+from queue import Empty, Queue
+from threading import Thread
+from util.device import Device
+from util.logger import Logger
+
+
+class AdbError(Exception):
+    """Raised when the ADB server refuses or fails a request."""
+    pass
+
+
+class Adb(object):
+
+    SERVER_HOST = '127.0.0.1'
+    SERVER_PORT = 5037
+    SHELL_SENTINEL = '__alauto_done__'
+    RETRIES = 2
+    SHELL_TIMEOUT = 10
+    SOCKET_TIMEOUT = 10
+
+    @classmethod
+    def init(cls):
+        """Kills and starts a new ADB server
+        """
+        if Device.current().backend is not None:
+            return
+        cls.close_shell()
+        cls.kill_server()
+        cls.start_server()
+
+    @staticmethod
+    def use_device(device):
+        """Routes every command for the active device to the passed in device
+        instead of ADB, e.g. a FakeDevice for running without an emulator.
+
+        Args:
+            device (FakeDevice): Device to send commands to, or None to go
+                back to using ADB.
+        """
+        Device.current().backend = device
+
+    @staticmethod
+    def _client(*args):
+        """Builds the adb client command for the active device.
+
+        Args:
+            args (tuple): Arguments of the adb command.
+
+        Returns:
+            list: the adb command line
+        """
+        serial = Device.current().serial
+        return ['adb'] + (['-s', serial] if serial else []) + list(args)
+
+    @staticmethod
+    def start_server():
+        """Starts the ADB server
+        """
+        cmd = ['adb', 'start-server']
+        subprocess.call(cmd)
+
+    @staticmethod
+    def kill_server():
+        """Kills the ADB server
+        """
+        cmd = ['adb', 'kill-server']
+        subprocess.call(cmd)
+
+    @classmethod
+    def exec_out(cls, args):
+        """Executes the command via exec-out. The command is sent straight to
+        the ADB server socket so no adb client process is spawned; the
+        subprocess client is only used if the socket keeps failing or stalls
+        for more than SOCKET_TIMEOUT seconds.
+
+        Args:
+            args (string): Command to execute.
+
+        Returns:
+            bytes: The stdout data of the command
+        """
+        device = Device.current()
+        if device.backend is not None:
+            return device.backend.exec_out(args)
+        for _ in range(cls.RETRIES):
+            try:
+                return cls._socket_request('exec:{}'.format(args))
+            except (OSError, AdbError) as e:
+                Logger.log_warning(
+                    'ADB socket request failed ({}), retrying.'.format(e))
+        return cls._run_client(
+            cls._client('exec-out', *args.split(' ')), cls.SOCKET_TIMEOUT)
+
+    @classmethod
+    def shell(cls, args, timeout=SHELL_TIMEOUT):
+        """Executes the command via the persistent adb shell session, starting
+        or restarting the session as needed. The command is only sent again
+        if it could not be written to the session: input commands are not
+        idempotent, so once it was written a failure or timeout is raised to
+        the caller instead of replaying inputs that may have landed.
+
+        Args:
+            args (string): Command to execute.
+            timeout (float, optional): Defaults to SHELL_TIMEOUT. Seconds to
+                wait for the command to finish.
+
+        Returns:
+            string: The output of the command
+        """
+        device = Device.current()
+        if device.backend is not None:
+            return device.backend.shell(args)
+        with device.shell_lock:
+            for _ in range(cls.RETRIES):
+                try:
+                    cls._shell_write(args)
+                except (OSError, AdbError) as e:
+                    Logger.log_warning(
+                        'ADB shell session failed ({}), reconnecting.'
+                        .format(e))
+                    cls._close_shell()
+                    continue
+                try:
+                    return cls._shell_read(timeout)
+                except (OSError, AdbError):
+                    cls._close_shell()
+                    raise
+        return cls._run_client(
+            cls._client('shell', *args.split(' ')), timeout).decode(
+                'utf-8', 'replace')
+
+    @classmethod
+    def close_shell(cls):
+        """Terminates the persistent adb shell session of the active device if
+        one is running
+        """
+        with Device.current().shell_lock:
+            cls._close_shell()
+
+    @staticmethod
+    def _close_shell():
+        """Terminates the persistent adb shell session of the active device.
+        The caller must hold the shell lock.
+        """
+        device = Device.current()
+        if device.shell_process is not None:
+            try:
+                device.shell_process.kill()
+                device.shell_process.wait()
+            except OSError:
+                pass
+            device.shell_process = None
+            device.shell_lines = None
+
+    @staticmethod
+    def _read_lines(stream, lines):
+        """Reads the output of a shell session line by line into a queue until
+        the session closes, then queues an empty line. Runs in its own thread
+        so a command that never finishes cannot block the reader forever.
+
+        Args:
+            stream (file): stdout of the shell session.
+            lines (Queue): Queue the lines are put on.
+        """
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+        lines.put(b'')
+
+    @staticmethod
+    def _run_client(cmd, timeout):
+        """Runs an adb client command, killing it if it does not finish in
+        time.
+
+        Args:
+            cmd (list): The adb command line.
+            timeout (float): Seconds to wait for the command to finish.
+
+        Returns:
+            bytes: The stdout data of the command
+        """
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        try:
+            return process.communicate(timeout=timeout)[0]
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AdbError('{} timed out'.format(' '.join(cmd)))
+
+    @classmethod
+    def _shell_write(cls, args):
+        """Writes the command to the persistent shell session followed by an
+        echo of the sentinel, starting the session if it is not running.
+
+        Args:
+            args (string): Command to execute.
+        """
+        device = Device.current()
+        if (device.shell_process is None or
+                device.shell_process.poll() is not None):
+            device.shell_process = subprocess.Popen(
+                cls._client('shell'), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            device.shell_lines = Queue()
+            Thread(target=cls._read_lines, daemon=True, args=(
+                device.shell_process.stdout, device.shell_lines)).start()
+        process = device.shell_process
+        process.stdin.write('{}; echo {}\n'.format(
+            args, cls.SHELL_SENTINEL).encode('utf-8'))
+        process.stdin.flush()
+
+    @classmethod
+    def _shell_read(cls, timeout):
+        """Reads the output of the command last written to the persistent
+        shell session until the sentinel is seen.
+
+        Args:
+            timeout (float): Seconds to wait for the sentinel.
+
+        Returns:
+            string: The output of the command
+        """
+        device = Device.current()
+        output = []
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = device.shell_lines.get(
+                    timeout=max(0, deadline - time.monotonic()))
+            except Empty:
+                raise AdbError('shell command timed out')
+            if not line:
+                raise AdbError('shell session closed')
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if line == cls.SHELL_SENTINEL:
+                return '\n'.join(output)
+            output.append(line)
+
+    @classmethod
+    def _socket_request(cls, service):
+        """Opens a connection to the ADB server, switches it to the transport
+        of the active device and requests the service, returning everything
+        the service writes back.
+
+        Args:
+            service (string): ADB service to request, e.g. 'exec:ls'.
+
+        Returns:
+            bytes: The data sent back by the service
+        """
+        conn = socket.create_connection(
+            (cls.SERVER_HOST, cls.SERVER_PORT), cls.SOCKET_TIMEOUT)
+        try:
+            serial = Device.current().serial
+            cls._send(conn, 'host:transport:{}'.format(serial) if serial
+                      else 'host:transport-any')
+            cls._send(conn, service)
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        finally:
+            conn.close()
+
+    @classmethod
+    def _send(cls, conn, message):
+        """Sends a length-prefixed message to the ADB server and checks its
+        response status.
+
+        Args:
+            conn (socket): Connection to the ADB server.
+            message (string): Message to send.
+        """
+        conn.sendall('{:04x}{}'.format(
+            len(message), message).encode('utf-8'))
+        status = cls._recv_exactly(conn, 4)
+        if status != b'OKAY':
+            length = int(cls._recv_exactly(conn, 4), 16)
+            raise AdbError(cls._recv_exactly(conn, length).decode(
+                'utf-8', 'replace'))
+
+    @staticmethod
+    def _recv_exactly(conn, size):
+        """Reads exactly size bytes from the connection.
+
+        Args:
+            conn (socket): Connection to read from.
+            size (int): Number of bytes to read.
+
+        Returns:
+            bytes: The bytes read
+        """
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise AdbError('connection closed by ADB server')
+            data += chunk
+        return data
@@ -2,6 +2,8 @@ import configparser
 import sys
 from copy import deepcopy
 from util.logger import Logger
+from util.polling import PollingStrategy
+from util.touchscreen import Touchscreen
 
 
 class Config(object):
@@ -25,6 +27,34 @@ class Config(object):
         self.commissions = {'enabled': False}
         self.combat = {'enabled': False}
         self.missions = {'enabled': False}
+        self.screen = {
+            'capture_mode': 'raw',
+            'streaming': False,
+            'stream_buffer': 3,
+            'max_frame_age': 0.25,
+            'watch_assets': False,
+            'search_regions': True,
+            'region_fallback': True,
+            'pyramid_levels': 2,
+            'polling': 'fixed',
+            'poll_interval': 0.25,
+            'poll_max_interval': 2.0,
+            'max_captures_per_second': 10,
+            'frame_gating': False,
+            'gate_threshold': 8,
+            'match_workers': 0,
+            'spectrum_matching': True
+        }
+        self.input = {'mode': 'input', 'device': None}
+        self.scheduler = {'check_interval': 60}
+        self.state = {'file': 'state.json'}
+        self.metrics = {
+            'enabled': False,
+            'prometheus_file': None,
+            'port': 0,
+            'series_file': None,
+            'export_interval': 60
+        }
         self.read()
 
     def read(self):
@@ -38,6 +68,11 @@ class Config(object):
         else:
             self.combat = {'enabled': False}
         self.missions['enabled'] = config.getboolean('Missions', 'Enabled')
+        self._read_screen(config)
+        self._read_input(config)
+        self._read_scheduler(config)
+        self._read_metrics(config)
+        self._read_state(config)
         self.validate()
         if (self.ok and not self.initialized):
             Logger.log_msg("Starting azurlane-auto!")
@@ -71,6 +106,91 @@ class Config(object):
         self.combat['boss_fleet'] = config.getboolean('Combat', 'BossFleet')
         self.combat['kills_needed'] = config.getint('Combat', 'KillsNeeded')
 
+    def _read_screen(self, config):
+        """Method to parse the Screen settings of the passed in config. The
+        section is optional; missing settings keep their defaults.
+        Args:
+            config (ConfigParser): ConfigParser instance
+        """
+        self.screen['capture_mode'] = config.get(
+            'Screen', 'CaptureMode', fallback='raw').lower()
+        self.screen['streaming'] = config.getboolean(
+            'Screen', 'Streaming', fallback=False)
+        self.screen['stream_buffer'] = config.getint(
+            'Screen', 'StreamBuffer', fallback=3)
+        self.screen['max_frame_age'] = config.getfloat(
+            'Screen', 'MaxFrameAge', fallback=0.25)
+        self.screen['watch_assets'] = config.getboolean(
+            'Screen', 'WatchAssets', fallback=False)
+        self.screen['search_regions'] = config.getboolean(
+            'Screen', 'SearchRegions', fallback=True)
+        self.screen['region_fallback'] = config.getboolean(
+            'Screen', 'RegionFallback', fallback=True)
+        self.screen['pyramid_levels'] = config.getint(
+            'Screen', 'PyramidLevels', fallback=2)
+        self.screen['polling'] = config.get(
+            'Screen', 'Polling', fallback='fixed').lower()
+        self.screen['poll_interval'] = config.getfloat(
+            'Screen', 'PollInterval', fallback=0.25)
+        self.screen['poll_max_interval'] = config.getfloat(
+            'Screen', 'PollMaxInterval', fallback=2.0)
+        self.screen['max_captures_per_second'] = config.getfloat(
+            'Screen', 'MaxCapturesPerSecond', fallback=10)
+        self.screen['frame_gating'] = config.getboolean(
+            'Screen', 'FrameGating', fallback=False)
+        self.screen['gate_threshold'] = config.getfloat(
+            'Screen', 'GateThreshold', fallback=8)
+        self.screen['match_workers'] = config.getint(
+            'Screen', 'MatchWorkers', fallback=0)
+        self.screen['spectrum_matching'] = config.getboolean(
+            'Screen', 'SpectrumMatching', fallback=True)
+
+    def _read_input(self, config):
+        """Method to parse the Input settings of the passed in config. The
+        section is optional; missing settings keep their defaults.
+        Args:
+            config (ConfigParser): ConfigParser instance
+        """
+        self.input['mode'] = config.get(
+            'Input', 'Mode', fallback='input').lower()
+        self.input['device'] = config.get(
+            'Input', 'Device', fallback='') or None
+
+    def _read_scheduler(self, config):
+        """Method to parse the Scheduler settings of the passed in config. The
+        section is optional; missing settings keep their defaults.
+        Args:
+            config (ConfigParser): ConfigParser instance
+        """
+        self.scheduler['check_interval'] = config.getfloat(
+            'Scheduler', 'CheckInterval', fallback=60)
+
+    def _read_metrics(self, config):
+        """Method to parse the Metrics settings of the passed in config. The
+        section is optional; missing settings keep their defaults.
+        Args:
+            config (ConfigParser): ConfigParser instance
+        """
+        self.metrics['enabled'] = config.getboolean(
+            'Metrics', 'Enabled', fallback=False)
+        self.metrics['prometheus_file'] = config.get(
+            'Metrics', 'PrometheusFile', fallback='') or None
+        self.metrics['port'] = config.getint(
+            'Metrics', 'PrometheusPort', fallback=0)
+        self.metrics['series_file'] = config.get(
+            'Metrics', 'SeriesFile', fallback='') or None
+        self.metrics['export_interval'] = config.getfloat(
+            'Metrics', 'ExportInterval', fallback=60)
+
+    def _read_state(self, config):
+        """Method to parse the State settings of the passed in config. The
+        section is optional; missing settings keep their defaults.
+        Args:
+            config (ConfigParser): ConfigParser instance
+        """
+        self.state['file'] = config.get(
+            'State', 'File', fallback='state.json') or None
+
     def validate(self):
         def try_cast_to_int(val):
             """Helper function that attempts to coerce the val to an int,
@@ -105,6 +225,46 @@ class Config(object):
                 Logger.log_error("Invalid Map Selected: '{}'."
                                  .format(self.combat['map']))
 
+        if self.screen['capture_mode'] not in ['raw', 'png']:
+            self.ok = False
+            Logger.log_error("Invalid Capture Mode: '{}'."
+                             .format(self.screen['capture_mode']))
+        if self.screen['stream_buffer'] < 1:
+            self.ok = False
+            Logger.log_error("Invalid Stream Buffer: '{}'."
+                             .format(self.screen['stream_buffer']))
+        if self.screen['pyramid_levels'] < 0:
+            self.ok = False
+            Logger.log_error("Invalid Pyramid Levels: '{}'."
+                             .format(self.screen['pyramid_levels']))
+        if self.screen['match_workers'] < 0:
+            self.ok = False
+            Logger.log_error("Invalid Match Workers: '{}'."
+                             .format(self.screen['match_workers']))
+        if self.screen['polling'] not in PollingStrategy.MODES:
+            self.ok = False
+            Logger.log_error("Invalid Polling: '{}'."
+                             .format(self.screen['polling']))
+
+        if self.input['mode'] not in Touchscreen.MODES:
+            self.ok = False
+            Logger.log_error("Invalid Input Mode: '{}'."
+                             .format(self.input['mode']))
+
+        if self.scheduler['check_interval'] <= 0:
+            self.ok = False
+            Logger.log_error("Invalid Check Interval: '{}'."
+                             .format(self.scheduler['check_interval']))
+
+        if not 0 <= self.metrics['port'] <= 65535:
+            self.ok = False
+            Logger.log_error("Invalid Prometheus Port: '{}'."
+                             .format(self.metrics['port']))
+        if self.metrics['export_interval'] <= 0:
+            self.ok = False
+            Logger.log_error("Invalid Export Interval: '{}'."
+                             .format(self.metrics['export_interval']))
+
     def _rollback_config(self, config):
         """Method to roll back the config to the passed in config's.
         Args:
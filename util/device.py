@@ -0,0 +1,75 @@
+from threading import Lock, local
+
+
+class Device(object):
+
+    local = local()
+    default = None
+
+    def __init__(self, serial=None):
+        """Initializes a Device, which holds the state azurlane-auto keeps for
+        one emulator or phone: the ADB serial, the shell session, the screen
+        stream, the last captured frame and its cached matches, and the
+        touchscreen. Adb, Utils and Touchscreen act on the device that is
+        active in the calling thread, or on the default device if none is.
+
+        Args:
+            serial (string, optional): Defaults to None. ADB serial of the
+                device; any single connected device is used if None.
+        """
+        self.serial = serial
+        self.backend = None
+        self.shell_process = None
+        self.shell_lines = None
+        self.shell_lock = Lock()
+        self.clock = None
+        self.capture_mode = 'raw'
+        self.stream = None
+        self.frame_gate = None
+        self.current_frame = None
+        self.memo = {}
+        self.memo_lock = Lock()
+        self.last_capture = None
+        self.capture_lock = Lock()
+        self.last_wait_captures = 0
+        self.input_mode = 'input'
+        self.touch_node = None
+        self.touch_max_x = None
+        self.touch_max_y = None
+        self.touch_tracking_id = 0
+
+    @classmethod
+    def current(cls):
+        """Returns the device that is active in the calling thread.
+
+        Returns:
+            Device: the active device, or the default device
+        """
+        return getattr(cls.local, 'device', None) or cls.default
+
+    def activate(self):
+        """Makes this the active device of the calling thread.
+        """
+        Device.local.device = self
+
+    def bind(self, func):
+        """Wraps the function so it runs with this device active, whichever
+        thread calls it.
+
+        Args:
+            func (function): Function to wrap.
+
+        Returns:
+            function: the wrapped function
+        """
+        def bound(*args, **kwargs):
+            previous = getattr(Device.local, 'device', None)
+            Device.local.device = self
+            try:
+                return func(*args, **kwargs)
+            finally:
+                Device.local.device = previous
+        return bound
+
+
+Device.default = Device()
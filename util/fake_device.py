@@ -0,0 +1,210 @@
+import cv2
+import glob
+import json
+import os
+import shlex
+import struct
+from datetime import datetime, timedelta
+from threading import Lock
+from util.logger import Logger
+
+
+class VirtualClock(object):
+
+    def __init__(self, start=None):
+        """Initializes a VirtualClock, which only moves forward when it is
+        told to, so replayed runs do not wait on real time. It may be shared
+        by the devices of a replayed run.
+
+        Args:
+            start (datetime, optional): Defaults to now. Initial time.
+        """
+        self.time = datetime.now() if start is None else start
+        self.lock = Lock()
+
+    def now(self):
+        """Returns the current virtual time.
+
+        Returns:
+            datetime: the current virtual time
+        """
+        with self.lock:
+            return self.time
+
+    def sleep(self, seconds):
+        """Advances the virtual time.
+
+        Args:
+            seconds (float): Number of seconds to advance by.
+        """
+        with self.lock:
+            self.time += timedelta(seconds=seconds)
+
+
+class FakeDevice(object):
+
+    CAPTURE_SECONDS = 0.05
+    INPUT_SECONDS = 0.1
+
+    def __init__(self, source, clock=None):
+        """Initializes a FakeDevice, a simulated device that can stand in for
+        ADB. The source is either a directory of recorded screenshots, which
+        are served in order (the last one repeating), or a JSON script that
+        describes a state machine:
+
+            {
+                "start": "home",
+                "states": {
+                    "home": {
+                        "frame": "home.png",
+                        "taps": [{"region": [1000, 365, 180, 60],
+                                  "next": "map"}],
+                        "swipes": [{"region": [0, 0, 1280, 720],
+                                    "next": "map"}],
+                        "after": {"captures": 3, "next": "home"}
+                    }
+                }
+            }
+
+        Frame paths are relative to the script. A tap or swipe (by its start
+        point) inside a region moves to the next state; "after" moves to the
+        next state once the state has been captured that many times.
+
+        Args:
+            source (string): Path of the screenshot directory or JSON script.
+            clock (VirtualClock, optional): Defaults to a new clock. Clock
+                advanced by the captures and inputs.
+        """
+        self.clock = VirtualClock() if clock is None else clock
+        self.inputs = []
+        self.captures = 0
+        self.frames = {}
+        if os.path.isdir(source):
+            paths = sorted(glob.glob(os.path.join(source, '*.png')))
+            if not paths:
+                raise ValueError('no screenshots in {}'.format(source))
+            self.states = {
+                str(i): {
+                    'frame': path,
+                    'after': {'captures': 1, 'next': str(i + 1)}
+                } for i, path in enumerate(paths)}
+            self.states[str(len(paths) - 1)].pop('after')
+            self.state = '0'
+        else:
+            with open(source) as script_file:
+                script = json.load(script_file)
+            base = os.path.dirname(source)
+            self.states = script['states']
+            for state in self.states.values():
+                state['frame'] = os.path.join(base, state['frame'])
+            self.state = script['start']
+        self.state_captures = 0
+        Logger.log_msg('Simulating device with {} states from {}.'.format(
+            len(self.states), source))
+
+    def exec_out(self, args):
+        """Handles a command sent via exec-out. Only screencap is supported.
+
+        Args:
+            args (string): Command to execute.
+
+        Returns:
+            bytes: The screenshot of the current state, PNG encoded if -p was
+            passed and as a raw RGBA dump otherwise
+        """
+        command = args.split(' ')
+        if command[0] != 'screencap':
+            return b''
+        self.clock.sleep(self.CAPTURE_SECONDS)
+        self.captures += 1
+        data = self._frame('-p' in command)
+        self.state_captures += 1
+        after = self.states[self.state].get('after')
+        if after and self.state_captures >= after['captures']:
+            self._transition(after['next'])
+        return data
+
+    def shell(self, args):
+        """Handles a command sent via adb shell. Every input tap and swipe is
+        logged and may move the device to another state; other commands are
+        ignored.
+
+        Args:
+            args (string): Command to execute.
+
+        Returns:
+            string: empty output
+        """
+        for command in args.replace('&&', ';').split(';'):
+            words = shlex.split(command)
+            if len(words) < 2 or words[0] != 'input':
+                if words and words[0] == 'sleep':
+                    self.clock.sleep(float(words[1]))
+                continue
+            values = [int(float(value)) for value in words[2:]]
+            self.clock.sleep(self.INPUT_SECONDS)
+            self.inputs.append([words[1]] + values)
+            Logger.log_msg('[device] {} {}'.format(words[1], values))
+            if words[1] in ('tap', 'swipe'):
+                self._handle_input(words[1] + 's', values[0], values[1])
+        return ''
+
+    def _handle_input(self, kind, x, y):
+        """Moves to the next state of the first region of the current state
+        containing the input.
+
+        Args:
+            kind (string): 'taps' or 'swipes'.
+            x (int): x coordinate of the input.
+            y (int): y coordinate of the input.
+        """
+        for target in self.states[self.state].get(kind, []):
+            rx, ry, rw, rh = target['region']
+            if rx <= x <= rx + rw and ry <= y <= ry + rh:
+                self._transition(target['next'])
+                return
+
+    def _transition(self, state):
+        """Moves the device to the specified state.
+
+        Args:
+            state (string): Name of the state.
+        """
+        self.state = state
+        self.state_captures = 0
+
+    def _frame(self, png):
+        """Returns the encoded screenshot of the current state, encoding it
+        the first time it is requested.
+
+        Args:
+            png (bool): Whether to PNG encode the screenshot instead of
+                dumping raw RGBA pixels.
+
+        Returns:
+            bytes: the encoded screenshot
+        """
+        path = self.states[self.state]['frame']
+        key = (path, png)
+        if key not in self.frames:
+            image = cv2.imread(path)
+            if png:
+                self.frames[key] = cv2.imencode('.png', image)[1].tobytes()
+            else:
+                self.frames[key] = self.raw_screencap(image)
+        return self.frames[key]
+
+    @staticmethod
+    def raw_screencap(image):
+        """Converts an image to the raw output of screencap: a 16 byte header
+        (width, height, format, colorspace) followed by RGBA pixels.
+
+        Args:
+            image (image): A CV2 BGR image object.
+
+        Returns:
+            bytes: the raw screencap dump of the image
+        """
+        height, width = image.shape[:2]
+        return struct.pack('<IIII', width, height, 1, 0) + cv2.cvtColor(
+            image, cv2.COLOR_BGR2RGBA).tobytes()
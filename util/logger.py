@@ -1,6 +1,7 @@
 # kcauto  Copyright (C) 2017  Minyoung Choi
 
 from time import strftime
+from util.device import Device
 
 
 class Logger(object):
@@ -13,7 +14,8 @@ class Logger(object):
 
     @staticmethod
     def log_format(msg):
-        """Method to add a timestamp to a log message
+        """Method to add a timestamp, and the serial of the active device if
+        one was specified, to a log message
 
         Args:
             msg (string): log msg
@@ -21,6 +23,9 @@ class Logger(object):
         Returns:
             str: log msg with timestamp appended
         """
+        serial = Device.current().serial
+        if serial:
+            msg = "[{}] {}".format(serial, msg)
         return "[{}] {}".format(strftime("%Y-%m-%d %H:%M:%S"), msg)
 
     @classmethod
@@ -0,0 +1,73 @@
+import numpy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from util.matching import Matcher
+from util.templates import Templates
+
+
+def run_match(screen, request):
+    """Runs one matching request against the screen.
+
+    Args:
+        screen (image): A CV2 image object containing the screen.
+        request (tuple): tuple containing the name of the image, the
+            (x, y, width, height) region to search or None for the whole
+            screen, the similarity, the number of pyramid levels (0 to match
+            exhaustively) and whether to find all matches instead of the best.
+
+    Returns:
+        tuple: (value, x, y) of the best match on the screen, or a list of
+        (x, y, value) peaks on the screen if all matches were requested
+    """
+    image, roi, similarity, levels, find_all = request
+    template = Templates.get(image)
+    x, y = 0, 0
+    if roi is not None:
+        x, y = max(0, roi[0]), max(0, roi[1])
+        screen = screen[y:roi[1] + roi[3], x:roi[0] + roi[2]]
+    if (screen.shape[0] < template.shape[0] or
+            screen.shape[1] < template.shape[1]):
+        return [] if find_all else (-1.0, 0, 0)
+    if levels:
+        response = Matcher.pyramid_response(
+            screen, template, similarity, levels)
+    else:
+        response = Matcher.response(screen, template)
+    if find_all:
+        return [(px + x, py + y, value) for px, py, value
+                in Matcher.peaks(response, similarity)]
+    index = numpy.unravel_index(numpy.argmax(response), response.shape)
+    return float(response[index]), int(index[1]) + x, int(index[0]) + y
+
+
+class MatchPool(object):
+
+    def __init__(self, workers=None):
+        """Initializes a MatchPool, which fans template matching requests out
+        across cores. cv2.matchTemplate releases the GIL, so the requests run
+        in threads sharing the screen.
+
+        Args:
+            workers (int, optional): Defaults to the number of cores. Number
+                of workers.
+        """
+        self.workers = workers or os.cpu_count()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def map(self, screen, requests):
+        """Runs the matching requests against the screen across the workers.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            requests (list): list of requests, see run_match.
+
+        Returns:
+            list: the result of each request, in order
+        """
+        return list(self.executor.map(
+            lambda request: run_match(screen, request), requests))
+
+    def shutdown(self):
+        """Stops the workers.
+        """
+        self.executor.shutdown()
@@ -0,0 +1,254 @@
+import cv2
+import numpy
+
+
+class Matcher(object):
+
+    PYRAMID_MIN_SIZE = 8
+    PYRAMID_SLACK = 0.35
+    PYRAMID_CANDIDATES = 32
+    NMS_RADIUS = 10
+
+    @staticmethod
+    def response(screen, template):
+        """Computes the exhaustive normalized correlation response of the
+        template over the screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            template (image): A CV2 image object containing the template.
+
+        Returns:
+            ndarray: The response map, one value per template position
+        """
+        return cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
+
+    @classmethod
+    def pyramid_levels(cls, template, levels):
+        """Returns how many times the template can be halved, up to levels,
+        while keeping both of its sides at least PYRAMID_MIN_SIZE pixels.
+
+        Args:
+            template (image): A CV2 image object containing the template.
+            levels (int): Maximum number of levels.
+
+        Returns:
+            int: The number of usable pyramid levels
+        """
+        usable = 0
+        while (usable < levels and
+               min(template.shape) >> (usable + 1) >= cls.PYRAMID_MIN_SIZE):
+            usable += 1
+        return usable
+
+    @classmethod
+    def pyramid_response(cls, screen, template, similarity, levels):
+        """Computes the response of the template over the screen coarse to
+        fine: the template is first matched against a downscaled screen, and
+        only the neighbourhoods of the coarse candidates are then matched at
+        full resolution. Positions that were not refined are left at -1, so
+        the result can be thresholded like the exhaustive response. Falls
+        back to the exhaustive response if the template is too small to
+        downscale.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            template (image): A CV2 image object containing the template.
+            similarity (float): Percentage in similarity that the template
+                should at least match.
+            levels (int): Maximum number of times to halve the screen and
+                template.
+
+        Returns:
+            ndarray: The response map, one value per template position
+        """
+        levels = cls.pyramid_levels(template, levels)
+        if levels == 0:
+            return cls.response(screen, template)
+        small_screen, small_template = screen, template
+        for _ in range(levels):
+            small_screen = cv2.pyrDown(small_screen)
+            small_template = cv2.pyrDown(small_template)
+        coarse = cls.response(small_screen, small_template)
+
+        # Keep the strongest coarse local maxima above the relaxed threshold
+        peaks = (coarse == cv2.dilate(coarse, numpy.ones((3, 3)))) & (
+            coarse >= similarity - cls.PYRAMID_SLACK)
+        ys, xs = numpy.nonzero(peaks)
+        order = numpy.argsort(coarse[ys, xs])[::-1][:cls.PYRAMID_CANDIDATES]
+
+        height, width = template.shape
+        result = numpy.full(
+            (screen.shape[0] - height + 1, screen.shape[1] - width + 1),
+            -1, dtype=numpy.float32)
+        scale = 1 << levels
+        for i in order:
+            x1 = max(0, xs[i] * scale - scale)
+            y1 = max(0, ys[i] * scale - scale)
+            x2 = min(result.shape[1], xs[i] * scale + scale + 1)
+            y2 = min(result.shape[0], ys[i] * scale + scale + 1)
+            result[y1:y2, x1:x2] = cls.response(
+                screen[y1:y2 + height - 1, x1:x2 + width - 1], template)
+        return result
+
+    @classmethod
+    def peaks(cls, response, similarity, radius=NMS_RADIUS):
+        """Finds the best location per object in a response map. Positions
+        above similarity that are the maximum of their neighbourhood are kept,
+        then any remaining peaks within radius of a stronger one (plateaus)
+        are suppressed.
+
+        Args:
+            response (ndarray): Response map of a template over a screen.
+            similarity (float): Percentage in similarity that the template
+                should at least match.
+            radius (int, optional): Defaults to NMS_RADIUS. Distance in pixels
+                within which matches are considered the same object.
+
+        Returns:
+            list: list of (x, y, confidence) tuples, best match first
+        """
+        above = response >= similarity
+        if not above.any():
+            return []
+        kernel = numpy.ones((2 * radius + 1, 2 * radius + 1), numpy.uint8)
+        ys, xs = numpy.nonzero(above & (response >= cv2.dilate(
+            response, kernel)))
+        return cls.suppress(xs, ys, response[ys, xs], radius)
+
+    @staticmethod
+    def suppress(xs, ys, scores, radius=NMS_RADIUS):
+        """Greedy non-maximum suppression of points: the highest scoring point
+        is kept and every point within radius of it is dropped, repeating
+        until no points are left.
+
+        Args:
+            xs (ndarray): x coordinates of the points.
+            ys (ndarray): y coordinates of the points.
+            scores (ndarray): Scores of the points.
+            radius (int, optional): Defaults to NMS_RADIUS. Distance in pixels
+                within which points are considered the same object.
+
+        Returns:
+            list: list of (x, y, score) tuples, highest score first
+        """
+        xs, ys = numpy.asarray(xs), numpy.asarray(ys)
+        scores = numpy.asarray(scores)
+        order = numpy.argsort(-scores, kind='stable')
+        xs, ys, scores = xs[order], ys[order], scores[order]
+        remaining = numpy.ones(len(xs), dtype=bool)
+        kept = []
+        for i in range(len(xs)):
+            if not remaining[i]:
+                continue
+            kept.append((int(xs[i]), int(ys[i]), float(scores[i])))
+            remaining &= (xs - xs[i]) ** 2 + (ys - ys[i]) ** 2 > radius ** 2
+        return kept
+
+
+class SpectrumMatcher(object):
+
+    EPSILON = 1e-6
+    # Windows whose pixels deviate less than this in total are flat; below it
+    # the float32 window sums are mostly rounding error
+    FLAT_DEVIATION = 1.0
+
+    spectra = {}
+
+    def __init__(self, screen):
+        """Initializes a SpectrumMatcher, which matches several templates
+        against one screen in the frequency domain. The screen is Fourier
+        transformed once; the spectrum of each template at that size is
+        computed once and cached across screens. The correlation of a
+        template is then one spectrum product and one inverse transform, and
+        is normalized like TM_CCOEFF_NORMED with box-filtered window sums,
+        which are shared by templates of the same size.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+        """
+        self.screen = screen
+        height, width = screen.shape
+        self.size = (cv2.getOptimalDFTSize(height),
+                     cv2.getOptimalDFTSize(width))
+        padded = numpy.zeros(self.size, numpy.float32)
+        padded[:height, :width] = screen
+        self.spectrum = cv2.dft(padded)
+        self.windows = {}
+
+    def response(self, template, key=None):
+        """Computes the normalized correlation response of the template over
+        the screen, equivalent to Matcher.response up to float precision.
+
+        Args:
+            template (image): A CV2 image object containing the template.
+            key (string, optional): Defaults to None. Name of the template to
+                cache its spectrum under; uncached if not specified.
+
+        Returns:
+            ndarray: The response map, one value per template position
+        """
+        height, width = template.shape
+        spectrum, norm = self._template_spectrum(template, key)
+        correlation = cv2.idft(
+            cv2.mulSpectrums(self.spectrum, spectrum, 0, conjB=True),
+            flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+        correlation = correlation[:self.screen.shape[0] - height + 1,
+                                  :self.screen.shape[1] - width + 1]
+        if norm < self.EPSILON:
+            return numpy.zeros_like(correlation)
+        result = cv2.divide(correlation, self._window_deviation(
+            height, width), scale=1 / norm)
+        return numpy.clip(result, -1, 1, out=result)
+
+    def _template_spectrum(self, template, key):
+        """Returns the spectrum of the zero-mean template padded to the
+        transform size of the screen, along with its norm.
+
+        Args:
+            template (image): A CV2 image object containing the template.
+            key (string): Name of the template to cache its spectrum under,
+                or None.
+
+        Returns:
+            tuple: the spectrum and the norm of the zero-mean template
+        """
+        entry = self.spectra.get((key, self.size))
+        # Reloaded templates are new arrays, so their spectra are recomputed
+        if key is not None and entry is not None and entry[0] is template:
+            return entry[1:]
+        centered = template.astype(numpy.float32) - template.mean()
+        padded = numpy.zeros(self.size, numpy.float32)
+        padded[:template.shape[0], :template.shape[1]] = centered
+        entry = (template, cv2.dft(padded),
+                 float(numpy.sqrt((centered ** 2).sum())))
+        if key is not None:
+            self.spectra[(key, self.size)] = entry
+        return entry[1:]
+
+    def _window_deviation(self, height, width):
+        """Returns the root of the summed squared deviation of the screen
+        from its mean in every template-sized window. Flat windows have no
+        defined correlation and are set to infinity, so dividing by them
+        gives 0 like TM_CCOEFF_NORMED does.
+
+        Args:
+            height (int): Height of the window.
+            width (int): Width of the window.
+
+        Returns:
+            ndarray: one value per template position, not to be modified
+        """
+        if (height, width) not in self.windows:
+            valid = (slice(0, self.screen.shape[0] - height + 1),
+                     slice(0, self.screen.shape[1] - width + 1))
+            sums, squares = [
+                box(self.screen, cv2.CV_32F, (width, height), anchor=(0, 0),
+                    normalize=False, borderType=cv2.BORDER_CONSTANT)[valid]
+                for box in (cv2.boxFilter, cv2.sqrBoxFilter)]
+            variance = cv2.subtract(squares, cv2.multiply(
+                sums, sums, scale=1 / (height * width)))
+            deviation = cv2.sqrt(cv2.max(variance, 0))
+            deviation[deviation < self.FLAT_DEVIATION] = numpy.inf
+            self.windows[(height, width)] = deviation
+        return self.windows[(height, width)]
@@ -0,0 +1,267 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import NamedTemporaryFile
+from threading import Lock, Thread
+from util.device import Device
+from util.logger import Logger
+
+
+class Metrics(object):
+
+    PREFIX = 'alauto_'
+    BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+               60, 120, 300, 600, 1800]
+
+    enabled = False
+    counters = {}
+    histograms = {}
+    lock = Lock()
+    series_file = None
+    prometheus_file = None
+    server = None
+    exporter = None
+
+    @classmethod
+    def init(cls, config):
+        """Applies the Metrics settings of the passed in Config instance,
+        starting the HTTP endpoint and the periodic export if they are
+        enabled.
+
+        Args:
+            config (Config): azurlane-auto Config instance
+        """
+        cls.enabled = config.metrics['enabled']
+        if not cls.enabled:
+            return
+        cls.series_file = config.metrics['series_file']
+        cls.prometheus_file = config.metrics['prometheus_file']
+        if config.metrics['port'] and cls.server is None:
+            cls.serve(config.metrics['port'])
+        if cls.exporter is None:
+            cls.export_every(config.metrics['export_interval'])
+
+    @classmethod
+    def increment(cls, name, value=1, record=True, **labels):
+        """Increments a counter and records the event in the time series log.
+
+        Args:
+            name (string): Name of the counter.
+            value (int, optional): Defaults to 1. Amount to increment by.
+            record (bool, optional): Defaults to True. Whether to record the
+                event in the time series log; frequent counters only show up
+                in the periodic snapshots.
+            labels (dict): Labels of the counter.
+        """
+        if not cls.enabled:
+            return
+        key = cls._key(name, labels)
+        with cls.lock:
+            cls.counters[key] = cls.counters.get(key, 0) + value
+        if record:
+            cls._append({'event': name, 'value': value,
+                         'labels': dict(key[1])})
+
+    @classmethod
+    def observe(cls, name, seconds, record=False, **labels):
+        """Adds a duration to a latency histogram, or a small count such as
+        the captures of a wait to a histogram of counts.
+
+        Args:
+            name (string): Name of the histogram.
+            seconds (float): Duration in seconds, or the count.
+            record (bool, optional): Defaults to False. Whether to also record
+                the observation in the time series log; frequent observations
+                only show up in the periodic snapshots.
+            labels (dict): Labels of the histogram.
+        """
+        if not cls.enabled:
+            return
+        key = cls._key(name, labels)
+        with cls.lock:
+            histogram = cls.histograms.get(key)
+            if histogram is None:
+                histogram = cls.histograms[key] = {
+                    'buckets': [0] * len(cls.BUCKETS), 'sum': 0, 'count': 0}
+            index = bisect_left(cls.BUCKETS, seconds)
+            if index < len(cls.BUCKETS):
+                histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+        if record:
+            cls._append({'event': name, 'value': round(seconds, 3),
+                         'labels': dict(key[1])})
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name, record=False, **labels):
+        """Context manager that observes how long its block takes.
+
+        Args:
+            name (string): Name of the histogram.
+            record (bool, optional): Defaults to False. See observe.
+            labels (dict): Labels of the histogram.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - start, record, **labels)
+
+    @classmethod
+    def prometheus(cls):
+        """Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            string: the metrics
+        """
+        lines = []
+        with cls.lock:
+            for name in sorted(set(key[0] for key in cls.counters)):
+                lines.append('# TYPE {}{}_total counter'.format(
+                    cls.PREFIX, name))
+                for key, value in sorted(cls.counters.items()):
+                    if key[0] == name:
+                        lines.append('{}{}_total{} {}'.format(
+                            cls.PREFIX, name, cls._labels(key[1]), value))
+            for name in sorted(set(key[0] for key in cls.histograms)):
+                lines.append('# TYPE {}{} histogram'.format(cls.PREFIX, name))
+                for key, histogram in sorted(cls.histograms.items()):
+                    if key[0] != name:
+                        continue
+                    total = 0
+                    for bound, count in zip(
+                            cls.BUCKETS + ['+Inf'],
+                            histogram['buckets'] + [0]):
+                        total += count
+                        lines.append('{}{}_bucket{} {}'.format(
+                            cls.PREFIX, name,
+                            cls._labels(key[1] + (('le', bound),)),
+                            histogram['count'] if bound == '+Inf'
+                            else total))
+                    lines.append('{}{}_sum{} {}'.format(
+                        cls.PREFIX, name, cls._labels(key[1]),
+                        round(histogram['sum'], 6)))
+                    lines.append('{}{}_count{} {}'.format(
+                        cls.PREFIX, name, cls._labels(key[1]),
+                        histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def export(cls):
+        """Writes the Prometheus file, replacing it atomically so scrapers
+        never read a partial file, and appends a snapshot of every metric to
+        the time series log.
+        """
+        if cls.prometheus_file:
+            directory = os.path.dirname(os.path.abspath(cls.prometheus_file))
+            with NamedTemporaryFile('w', dir=directory, delete=False) as tmp:
+                tmp.write(cls.prometheus())
+            os.replace(tmp.name, cls.prometheus_file)
+        with cls.lock:
+            snapshot = {
+                'counters': [[name, dict(labels), value] for
+                             (name, labels), value in cls.counters.items()],
+                'histograms': [
+                    [name, dict(labels), histogram['count'],
+                     round(histogram['sum'], 3)]
+                    for (name, labels), histogram in cls.histograms.items()]
+            }
+        cls._append(snapshot)
+
+    @classmethod
+    def export_every(cls, interval):
+        """Starts a background thread that exports the metrics every interval
+        seconds.
+
+        Args:
+            interval (float): Seconds between exports.
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    cls.export()
+                except OSError as e:
+                    Logger.log_warning(
+                        'Unable to export metrics: {}'.format(e))
+
+        cls.exporter = Thread(target=run, daemon=True)
+        cls.exporter.start()
+
+    @classmethod
+    def serve(cls, port):
+        """Serves the metrics in the Prometheus text format over HTTP on the
+        port from a background thread.
+
+        Args:
+            port (int): Port to listen on.
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = cls.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('', port), Handler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        Logger.log_msg('Serving metrics on port {}.'.format(port))
+
+    @staticmethod
+    def _key(name, labels):
+        """Builds the key of a metric, labelling it with the serial of the
+        active device if one was specified.
+
+        Args:
+            name (string): Name of the metric.
+            labels (dict): Labels of the metric.
+
+        Returns:
+            tuple: the name and the sorted label pairs
+        """
+        serial = Device.current().serial
+        if serial:
+            labels = dict(labels, device=serial)
+        return name, tuple(sorted(labels.items()))
+
+    @staticmethod
+    def _labels(pairs):
+        """Renders label pairs in the Prometheus format.
+
+        Args:
+            pairs (tuple): tuple of (name, value) tuples.
+
+        Returns:
+            string: the rendered labels, empty if there are none
+        """
+        if not pairs:
+            return ''
+        return '{{{}}}'.format(','.join(
+            '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+            for name, value in pairs))
+
+    @classmethod
+    def _append(cls, entry):
+        """Appends a timestamped entry to the time series log as one line of
+        JSON.
+
+        Args:
+            entry (dict): Entry to append.
+        """
+        if not cls.series_file:
+            return
+        entry = dict(entry, time=round(time.time(), 3))
+        line = json.dumps(entry, separators=(',', ':'), sort_keys=True)
+        with cls.lock:
+            with open(cls.series_file, 'a') as series:
+                series.write(line + '\n')
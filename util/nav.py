@@ -1,13 +1,97 @@
-from util.utils import Utils
+import heapq
+import itertools
+from threading import Lock
+from util.device import Device
+from util.logger import Logger
+from util.metrics import Metrics
+from util.scene import Scene
+from util.utils import Region, Utils
+
+
+class NavEdge(object):
+
+    DEFAULT_LATENCY = 1.0
+    MIN_TIMEOUT = 2.0
+    TIMEOUT_FACTOR = 3
+    SMOOTHING = 0.2
+
+    def __init__(self, source, target, region):
+        """Initializes a NavEdge instance, which represents a transition
+        between two screens made by touching a region, along with its
+        measured latency, captures and success rate.
+
+        Args:
+            source (string): Scene the transition starts from.
+            target (string): Scene the transition is expected to land on.
+            region (Region): Region to touch.
+        """
+        self.source = source
+        self.target = target
+        self.region = region
+        self.attempts = 0
+        self.successes = 0
+        self.latency = self.DEFAULT_LATENCY
+        self.captures = 1.0
+
+    def success_rate(self):
+        """Returns the success rate of the transition, smoothed so untried
+        and rarely tried transitions are neither trusted nor ruled out.
+
+        Returns:
+            float: the success rate, between 0 and 1
+        """
+        return (self.successes + 1) / (self.attempts + 2)
+
+    def cost(self):
+        """Returns the expected number of taps and captures spent to make the
+        transition, counting the retries a failing transition needs.
+
+        Returns:
+            float: the cost of the transition
+        """
+        return (1 + self.captures) / self.success_rate()
+
+    def timeout(self):
+        """Returns how long to wait for the transition to land before giving
+        up on it.
+
+        Returns:
+            float: number of seconds to wait
+        """
+        return max(self.MIN_TIMEOUT, self.TIMEOUT_FACTOR * self.latency)
+
+    def record(self, success, seconds, captures):
+        """Records the outcome of an attempt at the transition. Latency and
+        captures are exponential moving averages of the successful attempts.
+
+        Args:
+            success (bool): Whether the transition landed on its target.
+            seconds (float): Seconds from the touch until the scene changed.
+            captures (int): Number of captures made until the scene changed.
+        """
+        self.attempts += 1
+        if success:
+            self.successes += 1
+            self.latency += self.SMOOTHING * (seconds - self.latency)
+            self.captures += self.SMOOTHING * (captures - self.captures)
+
+    def __repr__(self):
+        """Returns a description of the transition for log messages.
+
+        Returns:
+            string: the source and target scenes
+        """
+        return '{} -> {}'.format(self.source, self.target)
 
 
 class NavNode(object):
 
     def __init__(self, name):
         """Initializes a NavNode instance, which represents a node in the
-        navigation tree.
+        navigation graph.
+
         Args:
-            name (string): name (in-game location) of the node
+            name (string): name (scene) of the node
         """
         self.name = name
         self.connections = {}
@@ -15,10 +99,156 @@ class NavNode(object):
 
 class Nav(object):
 
-    home = NavNode('home')
+    MAX_STEPS = 10
+    BACK = Region(12, 8, 45, 30)
+
+    # Transitions between scenes. Backing out of dialogs and unrecognized
+    # screens is how the modules used to recover, it is kept as an edge so
+    # its success rate is measured like any other
+    EDGES = [
+        (Scene.HOME, Scene.MAP, Region(1000, 365, 180, 60)),
+        (Scene.MAP, Scene.HOME, BACK),
+        (Scene.PRE_BATTLE, Scene.MAP, BACK),
+        (Scene.RESULTS, Scene.MAP, Region(0, 100, 150, 150)),
+        (Scene.DIALOG, Scene.HOME, BACK),
+        (Scene.UNKNOWN, Scene.HOME, BACK)
+    ]
+
+    nodes = {}
+    lock = Lock()
+
+    @classmethod
+    def connect(cls, source, target, region):
+        """Adds a transition to the navigation graph, replacing the one
+        between the same scenes if there is one.
+
+        Args:
+            source (string): Scene the transition starts from.
+            target (string): Scene the transition lands on.
+            region (Region): Region to touch.
+
+        Returns:
+            NavEdge: the new transition
+        """
+        edge = NavEdge(source, target, region)
+        with cls.lock:
+            for name in (source, target):
+                cls.nodes.setdefault(name, NavNode(name))
+            cls.nodes[source].connections[target] = edge
+        return edge
+
+    @classmethod
+    def route(cls, source, target):
+        """Finds the transitions with the lowest total cost from the source
+        to the target scene with Dijkstra's algorithm.
+
+        Args:
+            source (string): Scene to start from.
+            target (string): Scene to reach.
+
+        Returns:
+            list: list of NavEdge instances to traverse in order, empty if the
+            source is the target, or None if the target cannot be reached
+        """
+        counter = itertools.count()
+        queue = [(0, next(counter), source, [])]
+        visited = set()
+        with cls.lock:
+            while queue:
+                cost, _, name, path = heapq.heappop(queue)
+                if name == target:
+                    return path
+                if name in visited or name not in cls.nodes:
+                    continue
+                visited.add(name)
+                for edge in cls.nodes[name].connections.values():
+                    if edge.target not in visited:
+                        heapq.heappush(queue, (
+                            cost + edge.cost(), next(counter), edge.target,
+                            path + [edge]))
+        return None
+
+    @classmethod
+    def traverse(cls, edge):
+        """Touches the region of the transition and waits for the scene to
+        change, recording the outcome on the transition.
+
+        Args:
+            edge (NavEdge): Transition to make.
+
+        Returns:
+            string: the scene that was landed on, which is the source scene
+            if the screen did not change in time
+        """
+        Utils.touch_randomly(edge.region)
+        start = Utils.now()
+        scene = Utils.poll(
+            lambda screen: cls._changed(screen, edge.source), edge.timeout(),
+            edge.target)
+        seconds = (Utils.now() - start).total_seconds()
+        scene = edge.source if scene is None else scene
+        with cls.lock:
+            edge.record(scene == edge.target, seconds,
+                        Device.current().last_wait_captures)
+        Metrics.observe('nav_seconds', seconds, source=edge.source,
+                        target=edge.target, landed=scene)
+        return scene
+
+    @classmethod
+    def navigate_to(cls, target, max_steps=MAX_STEPS):
+        """Navigates to the target scene along the cheapest route, planning
+        the route again from wherever a transition lands if it is not where
+        it was expected to.
+
+        Args:
+            target (string): Scene to reach.
+            max_steps (int, optional): Defaults to MAX_STEPS. Maximum number
+                of transitions to make.
+
+        Returns:
+            bool: True if the target scene was reached, False otherwise
+        """
+        scene = Scene.classify()
+        steps = 0
+        while scene != target and steps < max_steps:
+            path = cls.route(scene, target)
+            if not path:
+                # Nothing to touch, e.g. in battle: wait for the screen to
+                # move on by itself
+                steps += 1
+                Utils.script_sleep(1)
+                scene = Scene.classify()
+                continue
+            for edge in path:
+                if steps >= max_steps:
+                    break
+                steps += 1
+                scene = cls.traverse(edge)
+                if scene != edge.target:
+                    Logger.log_msg(
+                        'Expected {} but landed on {}, re-planning.'.format(
+                            edge.target, scene))
+                    break
+        if scene != target:
+            Logger.log_error('Unable to navigate to {}, stuck on {}.'.format(
+                target, scene))
+            return False
+        return True
+
+    @staticmethod
+    def _changed(screen, source):
+        """Classifies the screen, for polling until it leaves a scene.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            source (string): Scene being left.
+
+        Returns:
+            string: the scene, or None if it is still the source scene
+        """
+        scene = Scene.classify(screen)
+        return None if scene == source else scene
+
 
-    def navigate_to(self, target):
-        regions = {
-            'back': Region(12, 8, 45, 30)
-        }
-        Utils.touch_randomly(regions[target])
+for edge in Nav.EDGES:
+    Nav.connect(*edge)
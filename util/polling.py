@@ -0,0 +1,48 @@
+class PollingStrategy(object):
+
+    MODES = ['fixed', 'backoff', 'change']
+
+    def __init__(self, mode='fixed', interval=0.25, max_interval=2.0,
+                 factor=2.0):
+        """Initializes a PollingStrategy, which decides how long the wait
+        helpers pause between checks of the screen.
+
+        fixed: pause interval seconds between checks.
+        backoff: start at interval and multiply the pause by factor after
+            every check, up to max_interval.
+        change: pause interval seconds between captures, but only re-check
+            when the screen changed since the previous capture.
+
+        Args:
+            mode (string, optional): Defaults to 'fixed'. One of MODES.
+            interval (float, optional): Defaults to 0.25. Initial pause in
+                seconds.
+            max_interval (float, optional): Defaults to 2.0. Longest pause in
+                seconds when backing off.
+            factor (float, optional): Defaults to 2.0. Backoff multiplier.
+        """
+        self.mode = mode
+        self.interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+
+    @property
+    def on_change(self):
+        """Whether checks should only be repeated when the screen changed.
+
+        Returns:
+            bool: True if the strategy is change-triggered
+        """
+        return self.mode == 'change'
+
+    def delays(self):
+        """Yields the pause before each successive check.
+
+        Yields:
+            float: pause in seconds
+        """
+        delay = self.interval
+        while True:
+            yield delay
+            if self.mode == 'backoff':
+                delay = min(delay * self.factor, self.max_interval)
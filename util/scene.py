@@ -0,0 +1,111 @@
+import cv2
+import numpy
+from collections import deque
+from threading import Lock
+from util.utils import Utils
+
+
+class Scene(object):
+
+    HOME = 'home'
+    MAP = 'map'
+    PRE_BATTLE = 'pre_battle'
+    IN_BATTLE = 'in_battle'
+    RESULTS = 'results'
+    DIALOG = 'dialog'
+    UNKNOWN = 'unknown'
+
+    # Probes in order of precedence: dialogs cover other screens, and the
+    # pre-battle screen shows the auto-battle toggle seen in battle as well
+    PROBES = [
+        (DIALOG, ['combat_evade', 'combat_items_received', 'combat_unable',
+                  'retire_confirm', 'confirm']),
+        (RESULTS, [('combat_battle_confirm', 0.85), 'combat_battle_complete']),
+        (PRE_BATTLE, ['combat_battle_start']),
+        (IN_BATTLE, ['combat_auto_enabled']),
+        (HOME, ['home_menu_build']),
+        (MAP, ['combat_fleet_marker', 'map_menu_hard', 'nav_page_combat'])
+    ]
+    FINGERPRINT_SIZE = (32, 18)
+    FINGERPRINT_THRESHOLD = 10
+    FINGERPRINTS_PER_SCENE = 32
+
+    fingerprints = {}
+    lock = Lock()
+
+    @classmethod
+    def classify(cls, screen=None):
+        """Labels the screen as one of the scenes. The screen is first
+        compared against small downsampled fingerprints of screens classified
+        before, which takes well under a millisecond; the largest cell
+        difference is used so a dialog popping up over a known screen is not
+        mistaken for it. If no fingerprint is close, the fixed-region
+        probes of every scene are matched and the fingerprint of the screen
+        is remembered, which costs several template matches. Classifying is
+        therefore meant for screens that look the same every time, not for
+        the map, whose view changes after every move.
+
+        Args:
+            screen (image, optional): Defaults to a new capture. A CV2 image
+                object containing the screen.
+
+        Returns:
+            string: the scene, or UNKNOWN if no scene was recognized
+        """
+        screen = Utils.update_screen() if screen is None else screen
+        fingerprint = cv2.resize(
+            screen, cls.FINGERPRINT_SIZE,
+            interpolation=cv2.INTER_AREA).astype(numpy.int16)
+        scene = cls._nearest(fingerprint)
+        if scene is not None:
+            return scene
+        scene = cls.probe(screen)
+        if scene != cls.UNKNOWN:
+            with cls.lock:
+                cls.fingerprints.setdefault(scene, deque(
+                    maxlen=cls.FINGERPRINTS_PER_SCENE)).append(fingerprint)
+        return scene
+
+    @classmethod
+    def probe(cls, screen):
+        """Labels the screen by matching the probes of every scene in order of
+        precedence.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+
+        Returns:
+            string: the scene, or UNKNOWN if no probe was found
+        """
+        scenes = {}
+        templates = []
+        for scene, probes in cls.PROBES:
+            for probe in probes:
+                name = probe if isinstance(probe, str) else probe[0]
+                scenes[name] = scene
+                templates.append(probe)
+        hits = Utils.detect_any(screen, templates)
+        for name in hits:
+            return scenes[name]
+        return cls.UNKNOWN
+
+    @classmethod
+    def _nearest(cls, fingerprint):
+        """Finds the scene of the remembered fingerprint closest to the
+        fingerprint.
+
+        Args:
+            fingerprint (ndarray): Fingerprint of the screen.
+
+        Returns:
+            string: the scene, or None if no fingerprint has every cell
+            within FINGERPRINT_THRESHOLD gray levels
+        """
+        best, best_distance = None, cls.FINGERPRINT_THRESHOLD
+        with cls.lock:
+            for scene, fingerprints in cls.fingerprints.items():
+                distances = numpy.abs(
+                    numpy.array(fingerprints) - fingerprint).max(axis=(1, 2))
+                if distances.min() < best_distance:
+                    best, best_distance = scene, distances.min()
+        return best
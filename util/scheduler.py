@@ -0,0 +1,190 @@
+import heapq
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from util.device import Device
+from util.logger import Logger
+from util.utils import Utils
+
+
+class Scheduler(object):
+
+    LOG_SLEEP_SECONDS = 300
+    RETRY_SECONDS = 60
+    VIRTUAL_POLL_SECONDS = 0.05
+
+    def __init__(self):
+        """Initializes a Scheduler, a priority queue of timed tasks. Each task
+        returns the time it next needs to run, and the scheduler sleeps until
+        the earliest task is due instead of polling every module in turn.
+        """
+        self.queue = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        """Returns the number of scheduled tasks.
+
+        Returns:
+            int: number of scheduled tasks
+        """
+        return len(self.queue)
+
+    def schedule(self, name, task, when=None, priority=0, group=None):
+        """Schedules a task. The task is called without arguments and returns
+        the datetime it next needs to run at, or None if it should not run
+        again. Tasks of the same group never run at the same time, e.g. the
+        tasks driving one device.
+
+        Args:
+            name (string): Name of the task, used in log messages.
+            task (function): Function to run.
+            when (datetime, optional): Defaults to now. Time to run the task
+                at.
+            priority (int, optional): Defaults to 0. Tasks due at the same
+                time run in ascending order of priority.
+            group (any, optional): Defaults to None. Group of the task.
+        """
+        when = Utils.now() if when is None else when
+        heapq.heappush(self.queue, (
+            when, priority, next(self.counter), name, task, group))
+
+    def next_time(self):
+        """Returns the time the earliest task is due at.
+
+        Returns:
+            datetime: the time the earliest task is due at, or None if no task
+            is scheduled
+        """
+        return self.queue[0][0] if self.queue else None
+
+    def run_next(self):
+        """Sleeps until the earliest task is due, runs it and reschedules it
+        at the time it returns.
+
+        Returns:
+            string: name of the task that was run, or None if no task is
+            scheduled
+        """
+        if not self.queue:
+            return None
+        entry = heapq.heappop(self.queue)
+        self._sleep_until(entry)
+        self._reschedule(entry, self._run_task(entry))
+        return entry[3]
+
+    def run(self, workers=1):
+        """Runs tasks as they become due until none are left. With more than
+        one worker, due tasks of different groups run concurrently in a
+        shared thread pool.
+
+        Args:
+            workers (int, optional): Defaults to 1. Number of tasks that may
+                run at the same time.
+        """
+        if workers <= 1:
+            while self.queue:
+                self.run_next()
+            return
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while self.queue or running:
+                self._submit_due(pool, running, workers)
+                if not running:
+                    self._sleep_until(self.queue[0])
+                    continue
+                done = wait(running, self._timeout(running, workers),
+                            FIRST_COMPLETED)[0]
+                for future in done:
+                    self._reschedule(running.pop(future), future.result())
+
+    def _submit_due(self, pool, running, workers):
+        """Submits the due tasks whose group is not already running to the
+        pool, keeping at most workers tasks running.
+
+        Args:
+            pool (ThreadPoolExecutor): Pool to run the tasks in.
+            running (dict): dict of the futures of the running tasks to their
+                queue entries.
+            workers (int): Number of tasks that may run at the same time.
+        """
+        now = Utils.now()
+        busy = set(entry[5] for entry in running.values())
+        deferred = []
+        while (self.queue and self.queue[0][0] <= now and
+               len(running) < workers):
+            entry = heapq.heappop(self.queue)
+            if entry[5] in busy:
+                deferred.append(entry)
+                continue
+            busy.add(entry[5])
+            running[pool.submit(self._run_task, entry)] = entry
+        for entry in deferred:
+            heapq.heappush(self.queue, entry)
+
+    def _run_task(self, entry):
+        """Runs the task of the queue entry. A task that raises is logged and
+        retried after RETRY_SECONDS instead of stopping the other tasks, e.g.
+        those of other devices.
+
+        Args:
+            entry (tuple): Queue entry of the task.
+
+        Returns:
+            datetime: the time the task next needs to run at, or None
+        """
+        try:
+            return entry[4]()
+        except Exception as e:
+            Logger.log_error('{} failed, retrying in {} seconds: {!r}'.format(
+                entry[3], self.RETRY_SECONDS, e))
+            return Utils.now() + timedelta(seconds=self.RETRY_SECONDS)
+
+    def _timeout(self, running, workers):
+        """Returns how long to wait for a running task to finish before the
+        next task that could start is due. With a virtual clock, time moves
+        with the running tasks rather than in real time, so the queue is
+        checked again every VIRTUAL_POLL_SECONDS instead.
+
+        Args:
+            running (dict): dict of the futures of the running tasks to their
+                queue entries.
+            workers (int): Number of tasks that may run at the same time.
+
+        Returns:
+            float: number of seconds to wait, or None to wait until a running
+            task finishes
+        """
+        if len(running) >= workers:
+            return None
+        busy = set(entry[5] for entry in running.values())
+        times = [entry[0] for entry in self.queue if entry[5] not in busy]
+        if not times:
+            return None
+        seconds = max(0, (min(times) - Utils.now()).total_seconds())
+        if Device.current().clock is not None:
+            return min(seconds, self.VIRTUAL_POLL_SECONDS)
+        return seconds
+
+    def _sleep_until(self, entry):
+        """Sleeps until the task of the queue entry is due.
+
+        Args:
+            entry (tuple): Queue entry of the task.
+        """
+        seconds = (entry[0] - Utils.now()).total_seconds()
+        if seconds >= self.LOG_SLEEP_SECONDS:
+            Logger.log_msg('Sleeping until {} is due in {}.'.format(
+                entry[3], timedelta(seconds=int(seconds))))
+        Utils.sleep(seconds)
+
+    def _reschedule(self, entry, when):
+        """Schedules the task of the queue entry again at the time it
+        returned.
+
+        Args:
+            entry (tuple): Queue entry of the task.
+            when (datetime): Time returned by the task, or None to drop it.
+        """
+        if when is not None:
+            _, priority, _, name, task, group = entry
+            self.schedule(name, task, when, priority, group)
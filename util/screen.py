@@ -0,0 +1,223 @@
+import cv2
+import numpy
+import time
+from collections import deque
+from threading import Condition, Thread
+from util.logger import Logger
+
+
+class ScreenStream(object):
+
+    IDLE_TIMEOUT = 5
+    FRAME_TIMEOUT = 10
+
+    def __init__(self, capture, size=3):
+        """Initializes a ScreenStream, a background producer that continuously
+        captures the device screen into a ring buffer of timestamped frames.
+        The producer pauses once no frame has been requested for IDLE_TIMEOUT
+        seconds and resumes on the next request.
+
+        Args:
+            capture (function): Function that captures and returns a frame.
+            size (int, optional): Defaults to 3. Number of frames to keep.
+        """
+        self.capture = capture
+        self.frames = deque(maxlen=size)
+        self.condition = Condition()
+        self.running = False
+        self.last_request = time.time()
+        self.thread = None
+
+    def start(self):
+        """Starts the capture thread if it is not already running.
+        """
+        if self.running:
+            return
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the capture thread and waits for it to finish.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def latest(self, max_age=None):
+        """Returns the newest frame in the buffer if it was captured no more
+        than max_age seconds before this request, otherwise waits for the
+        capture thread to produce one that was. If the capture thread has not
+        produced one within FRAME_TIMEOUT seconds, or is stopped, the frame
+        is captured directly instead.
+
+        Args:
+            max_age (float, optional): Defaults to None. Maximum age in
+                seconds of the returned frame; any age is accepted if None.
+
+        Returns:
+            image: A CV2 image object containing the device screen.
+        """
+        with self.condition:
+            self.last_request = time.time()
+            self.condition.notify_all()
+            oldest = None if max_age is None else self.last_request - max_age
+            deadline = self.last_request + self.FRAME_TIMEOUT
+            while True:
+                if self.frames:
+                    timestamp, frame = self.frames[-1]
+                    if oldest is None or timestamp >= oldest:
+                        return frame
+                remaining = deadline - time.time()
+                if not self.running or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+        Logger.log_warning('No frame streamed in time, capturing directly.')
+        return self.capture()
+
+    def _run(self):
+        """Capture loop run by the capture thread. Frames are timestamped with
+        the time the capture started, so a frame is never considered newer
+        than the screen state it shows.
+        """
+        while self.running:
+            with self.condition:
+                while (self.running and
+                       time.time() - self.last_request > self.IDLE_TIMEOUT):
+                    self.condition.wait()
+            if not self.running:
+                break
+            timestamp = time.time()
+            try:
+                frame = self.capture()
+            except Exception as e:
+                Logger.log_error('Screen capture failed: {}'.format(e))
+                time.sleep(1)
+                continue
+            with self.condition:
+                self.frames.append((timestamp, frame))
+                self.condition.notify_all()
+
+
+class ChangeDetector(object):
+
+    SIGNATURE_SIZE = (64, 36)
+
+    def __init__(self, threshold=8):
+        """Initializes a ChangeDetector, which tells whether a frame differs
+        from the last frame that counted as changed by comparing small
+        downsampled signatures. The largest per-cell difference is used
+        rather than the mean so a small element appearing on an otherwise
+        static screen still counts as a change.
+
+        Args:
+            threshold (float, optional): Defaults to 8. Absolute difference
+                in gray levels of any signature cell above which frames
+                differ.
+        """
+        self.threshold = threshold
+        self.reference = None
+
+    @classmethod
+    def signature(cls, frame):
+        """Computes the signature of a frame.
+
+        Args:
+            frame (image): A CV2 image object containing the screen.
+
+        Returns:
+            ndarray: the downsampled frame
+        """
+        return cv2.resize(
+            frame, cls.SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+
+    def changed(self, frame):
+        """Checks whether the frame differs from the last frame that counted
+        as changed, which becomes the new reference if it does.
+
+        Args:
+            frame (image): A CV2 image object containing the screen.
+
+        Returns:
+            bool: True if the frame changed or is the first frame
+        """
+        signature = self.signature(frame)
+        if (self.reference is not None and
+                cv2.absdiff(signature, self.reference).max() <=
+                self.threshold):
+            return False
+        self.reference = signature
+        return True
+
+
+class MotionEstimator(object):
+
+    SCALE = 0.25
+    MIN_RESPONSE = 0.1
+    MIN_OVERLAP = 64
+
+    @classmethod
+    def offset(cls, previous, current, expected=(0, 0)):
+        """Estimates how far the content of the screen moved between two
+        frames, e.g. after a swipe, by phase correlation of downsampled
+        frames. Phase correlation only recovers offsets under half the frame
+        size, so the parts of the frames that overlap if the content moved
+        by the expected offset are compared, which leaves a small residual to
+        find. Not moving at all is tried as well, for swipes stopped by the
+        edge of the map.
+
+        Args:
+            previous (image): A CV2 image object containing the earlier
+                screen.
+            current (image): A CV2 image object containing the later screen.
+            expected (tuple, optional): Defaults to (0, 0). (x, y) offset in
+                pixels the content is expected to have moved by, e.g. the
+                delta of the swipe.
+
+        Returns:
+            tuple: (x, y) offset in pixels the content moved by, or None if
+            neither guess correlated well enough to be trusted
+        """
+        best, best_response = None, cls.MIN_RESPONSE
+        for guess in set([tuple(int(round(v)) for v in expected), (0, 0)]):
+            offset, response = cls._correlate(previous, current, guess)
+            if response > best_response:
+                best, best_response = offset, response
+        return best
+
+    @classmethod
+    def _correlate(cls, previous, current, guess):
+        """Phase correlates the parts of the frames that overlap if the
+        content moved by the guessed offset.
+
+        Args:
+            previous (image): A CV2 image object containing the earlier
+                screen.
+            current (image): A CV2 image object containing the later screen.
+            guess (tuple): (x, y) guessed offset in pixels.
+
+        Returns:
+            tuple: the (x, y) offset in pixels and the peak response, which is
+            0 if the frames do not overlap enough
+        """
+        height, width = previous.shape[:2]
+        x, y = guess
+        overlap_width, overlap_height = width - abs(x), height - abs(y)
+        if min(overlap_width, overlap_height) < cls.MIN_OVERLAP:
+            return guess, 0
+        before = previous[max(0, -y):max(0, -y) + overlap_height,
+                          max(0, -x):max(0, -x) + overlap_width]
+        after = current[max(0, y):max(0, y) + overlap_height,
+                        max(0, x):max(0, x) + overlap_width]
+        before, after = [
+            cv2.resize(frame, None, fx=cls.SCALE, fy=cls.SCALE,
+                       interpolation=cv2.INTER_AREA).astype(numpy.float32)
+            for frame in (before, after)]
+        window = cv2.createHanningWindow(
+            (before.shape[1], before.shape[0]), cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(before, after, window)
+        return (int(round(x + dx / cls.SCALE)),
+                int(round(y + dy / cls.SCALE))), response
@@ -0,0 +1,262 @@
+import numpy
+from scipy import spatial
+
+
+class EnemyIndex(object):
+
+    DEFAULT_TOLERANCE = 10
+
+    def __init__(self, coords, tolerance=DEFAULT_TOLERANCE):
+        """Initializes an EnemyIndex, a spatial index over the enemy
+        coordinates found in one detection pass. The tree is built once;
+        swipes are applied as an offset to queries instead of rebuilding it.
+
+        Args:
+            coords (array): Array of enemy coordinates on the screen.
+            tolerance (int, optional): Defaults to DEFAULT_TOLERANCE. Distance
+                in pixels within which a blacklisted coordinate excludes an
+                enemy.
+        """
+        self.coords = numpy.asarray(coords, dtype=float).reshape(-1, 2)
+        self.tree = spatial.cKDTree(self.coords) if len(self.coords) else None
+        self.offset = numpy.zeros(2)
+        self.tolerance = tolerance
+        self.excluded = numpy.zeros(len(self.coords), dtype=bool)
+
+    def __len__(self):
+        """Returns the number of enemies that are not blacklisted.
+
+        Returns:
+            int: number of enemies in the index
+        """
+        return int(numpy.count_nonzero(~self.excluded))
+
+    def shift(self, x, y):
+        """Moves every enemy by the specified offset, e.g. after the screen
+        was swiped.
+
+        Args:
+            x (int): Horizontal offset in pixels.
+            y (int): Vertical offset in pixels.
+        """
+        self.offset += (x, y)
+
+    def add(self, coords):
+        """Adds newly found enemies to the index, skipping any that are within
+        tolerance of an enemy already in it.
+
+        Args:
+            coords (array): Array of enemy coordinates on the screen.
+        """
+        coords = numpy.asarray(coords, dtype=float).reshape(-1, 2)
+        coords = coords - self.offset
+        if self.tree is not None:
+            distances = self.tree.query(coords)[0]
+            coords = coords[distances > self.tolerance]
+        if len(coords) == 0:
+            return
+        self.coords = numpy.vstack([self.coords, coords])
+        self.excluded = numpy.concatenate(
+            [self.excluded, numpy.zeros(len(coords), dtype=bool)])
+        self.tree = spatial.cKDTree(self.coords)
+
+    def blacklist(self, coord, tolerance=None):
+        """Excludes every enemy within tolerance of the coordinate from
+        future queries.
+
+        Args:
+            coord (array): Array containing x and y of the coordinate.
+            tolerance (int, optional): Defaults to the index tolerance.
+        """
+        if self.tree is None:
+            return
+        tolerance = self.tolerance if tolerance is None else tolerance
+        for i in self.tree.query_ball_point(
+                numpy.asarray(coord, dtype=float) - self.offset, tolerance):
+            self.excluded[i] = True
+
+    def nearest(self, coord, k=1):
+        """Finds the enemies closest to the coordinate, skipping blacklisted
+        enemies.
+
+        Args:
+            coord (array): Array containing x and y of the coordinate.
+            k (int, optional): Defaults to 1. Number of enemies to return.
+
+        Returns:
+            list: list of up to k enemy coordinates on the screen, closest
+            first
+        """
+        if self.tree is None:
+            return []
+        count = min(len(self.coords), k + int(self.excluded.sum()))
+        _, indexes = self.tree.query(
+            numpy.asarray(coord, dtype=float) - self.offset, count)
+        indexes = numpy.atleast_1d(indexes)
+        indexes = indexes[~self.excluded[indexes]][:k]
+        return [[int(round(x)), int(round(y))]
+                for x, y in self.coords[indexes] + self.offset]
+
+    def coordinates(self):
+        """Returns the coordinates of every enemy that is not blacklisted.
+
+        Returns:
+            list: list of enemy coordinates on the screen
+        """
+        return [[int(round(x)), int(round(y))]
+                for x, y in self.coords[~self.excluded] + self.offset]
+
+
+class MapModel(object):
+
+    SCREEN_SIZE = (1280, 720)
+
+    def __init__(self, tolerance=EnemyIndex.DEFAULT_TOLERANCE):
+        """Initializes a MapModel, which remembers what was seen of a combat
+        map for a whole sortie. Screen observations are stitched into map
+        coordinates by tracking the position of the screen on the map: swipes
+        move it by their delta, and whenever the fleet marker is seen while
+        the map position of the fleet is known, the screen is anchored to it.
+        Coordinates are only meaningful while the model is registered; once
+        the position of the screen is lost, everything is forgotten.
+
+        Args:
+            tolerance (int, optional): Defaults to the EnemyIndex default.
+                Distance in pixels within which two enemies are the same.
+        """
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        """Forgets everything and unregisters the screen.
+        """
+        self.origin = numpy.zeros(2)
+        self.registered = False
+        self.enemies = numpy.zeros((0, 2))
+        self.index = EnemyIndex(self.enemies, self.tolerance)
+        self.fleet = None
+        self.boss = None
+
+    def to_map(self, coord):
+        """Converts screen coordinates to map coordinates.
+
+        Args:
+            coord (array): Array containing x and y on the screen.
+
+        Returns:
+            array: the x and y on the map
+        """
+        return numpy.asarray(coord[:2], dtype=float) + self.origin
+
+    def to_screen(self, coord):
+        """Converts map coordinates to screen coordinates.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+
+        Returns:
+            list: the x and y on the screen
+        """
+        x, y = numpy.asarray(coord, dtype=float) - self.origin
+        return [int(round(x)), int(round(y))]
+
+    def visible(self, coord, margin=0):
+        """Checks whether map coordinates are on the screen.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+            margin (int, optional): Defaults to 0. Distance in pixels from the
+                edges of the screen the coordinates must be within.
+
+        Returns:
+            bool: True if the coordinates are on the screen
+        """
+        x, y = self.to_screen(coord)
+        return (margin <= x < self.SCREEN_SIZE[0] - margin and
+                margin <= y < self.SCREEN_SIZE[1] - margin)
+
+    def pan(self, x, y):
+        """Moves the screen after the map was dragged by the offset, e.g. by
+        a swipe from (x1, y1) to (x2, y2) moving it by (x2 - x1, y2 - y1).
+
+        Args:
+            x (float): Horizontal offset in pixels.
+            y (float): Vertical offset in pixels.
+        """
+        self.origin -= (x, y)
+
+    def anchor_fleet(self, coord):
+        """Registers the screen using the fleet seen at the screen
+        coordinates. If the map position of the fleet is known, the screen
+        is moved so the fleet lines up with it; otherwise the fleet is placed
+        on the map at the current screen position, which starts a new map
+        if the screen was not registered.
+
+        Args:
+            coord (array): Array containing x and y of the fleet on the
+                screen.
+        """
+        if self.fleet is not None:
+            self.origin = self.fleet - numpy.asarray(coord, dtype=float)
+        else:
+            self.fleet = self.to_map(coord)
+        self.registered = True
+
+    def move_fleet(self, coord):
+        """Records that the fleet moved to map coordinates, e.g. onto an
+        enemy it defeated.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+        """
+        self.fleet = numpy.asarray(coord, dtype=float)
+
+    def observe(self, enemies, boss=None):
+        """Records what was seen on the screen. Remembered enemies that
+        should have been visible but were not seen are forgotten, so
+        defeated and moved enemies do not linger.
+
+        Args:
+            enemies (list): list of enemy coordinates on the screen.
+            boss (array, optional): Defaults to None. Coordinates of the boss
+                on the screen, if it was seen.
+        """
+        if not self.registered:
+            return
+        hidden = [coord for coord in self.enemies
+                  if not self.visible(coord, self.tolerance)]
+        seen = [self.to_map(coord) for coord in enemies]
+        self.enemies = numpy.asarray(hidden + seen, dtype=float).reshape(
+            -1, 2)
+        self.index = EnemyIndex(self.enemies, self.tolerance)
+        if boss is not None:
+            self.boss = self.to_map(boss)
+
+    def remove_enemy(self, coord):
+        """Forgets the enemies within tolerance of map coordinates.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+        """
+        distances = numpy.hypot(*(self.enemies - coord).T)
+        self.enemies = self.enemies[distances > self.tolerance]
+        self.index = EnemyIndex(self.enemies, self.tolerance)
+
+    def closest_enemy(self, coord, exclude=[]):
+        """Finds the remembered enemy closest to map coordinates, whether it
+        is on the screen or not.
+
+        Args:
+            coord (array): Array containing x and y on the map.
+            exclude (list, optional): Defaults to []. list of map
+                coordinates whose enemies should be skipped.
+
+        Returns:
+            array: the x and y on the map of the closest enemy, or None if no
+            enemy is remembered
+        """
+        for enemy in self.index.nearest(coord, len(self.index)):
+            if all(numpy.hypot(*(numpy.asarray(enemy) - excluded)) >
+                   self.tolerance for excluded in exclude):
+                return numpy.asarray(enemy, dtype=float)
+        return None
@@ -0,0 +1,79 @@
+import json
+import os
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from util.device import Device
+from util.logger import Logger
+
+
+class StateStore(object):
+
+    def __init__(self, path):
+        """Initializes a StateStore, which checkpoints the state of the
+        registered objects to a JSON file and restores it when they are
+        registered again after a restart. The file is replaced atomically,
+        so a crash while writing leaves the previous checkpoint intact. When
+        a device serial is specified, it is added to the file name so every
+        device keeps its own state.
+
+        Args:
+            path (string): Path of the state file.
+        """
+        serial = Device.current().serial
+        if serial:
+            root, ext = os.path.splitext(path)
+            path = '{}-{}{}'.format(
+                root, serial.replace(':', '_'), ext)
+        self.path = path
+        self.objects = {}
+        self.lock = Lock()
+        self.state = self.load()
+
+    def load(self):
+        """Reads the state file.
+
+        Returns:
+            dict: dict of the names of the registered objects to their
+            states, empty if there is no readable state file
+        """
+        try:
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            Logger.log_warning('Unable to read state file {}: {}'.format(
+                self.path, e))
+            return {}
+        Logger.log_msg('Restoring state from {}.'.format(self.path))
+        return state
+
+    def register(self, name, obj):
+        """Registers an object whose state is checkpointed, restoring its
+        state from the state file if it has one. The object must implement
+        get_state, returning a JSON serializable dict, and set_state, taking
+        that dict.
+
+        Args:
+            name (string): Name of the object in the state file.
+            obj (object): Object to checkpoint.
+        """
+        self.objects[name] = obj
+        if name in self.state:
+            obj.set_state(self.state[name])
+
+    def checkpoint(self):
+        """Writes the state of every registered object to the state file.
+        """
+        with self.lock:
+            for name, obj in self.objects.items():
+                self.state[name] = obj.get_state()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                with NamedTemporaryFile(
+                        'w', dir=directory, delete=False) as tmp:
+                    json.dump(self.state, tmp, indent=2)
+                os.replace(tmp.name, self.path)
+            except OSError as e:
+                Logger.log_warning('Unable to write state file {}: {}'.format(
+                    self.path, e))
@@ -2,6 +2,7 @@
 
 from datetime import datetime
 from util.logger import Logger
+from util.metrics import Metrics
 
 
 class Stats(object):
@@ -26,6 +27,29 @@ class Stats(object):
         self.missions_done = 0
         self.recoveries = 0
 
+    def get_state(self):
+        """Returns the stats for checkpointing.
+
+        Returns:
+            dict: dict of the stats
+        """
+        state = {name: getattr(self, name) for name in [
+            'cycles_completed', 'commissions_started', 'commissions_received',
+            'combat_attempted', 'combat_done', 'missions_done', 'recoveries']}
+        state['start_time'] = self.start_time.isoformat()
+        return state
+
+    def set_state(self, state):
+        """Restores checkpointed stats.
+
+        Args:
+            state (dict): dict of the stats
+        """
+        for name, value in state.items():
+            if name == 'start_time':
+                value = datetime.fromisoformat(value)
+            setattr(self, name, value)
+
     def _pretty_timedelta(self, delta):
         """Generate a human-readable time delta representation of how long the
         script has been running. Prettify code taken from:
@@ -96,33 +120,40 @@ class Stats(object):
         """Increments the number of cycles completed
         """
         self.cycles_completed += 1
+        Metrics.increment('cycles_completed')
 
     def increment_commissions_started(self):
         """Increments the number of commissions started
         """
         self.commissions_started += 1
+        Metrics.increment('commissions_started')
 
     def increment_commissions_received(self):
         """Increments the number of commissions received
         """
         self.commissions_received += 1
+        Metrics.increment('commissions_received')
 
     def increment_combat_attempted(self):
         """Increments the number of sorties attempted
         """
         self.combat_attempted += 1
+        Metrics.increment('combat_attempted')
 
     def increment_combat_done(self):
         """Increments the number of sorties completed
         """
         self.combat_done += 1
+        Metrics.increment('combat_done')
 
     def increment_missions_done(self):
         """Increments the number of missions completed
         """
         self.missions_done += 1
+        Metrics.increment('missions_done')
 
     def increment_recoveries(self):
         """Increments the number of recoveries completed
         """
         self.recoveries += 1
+        Metrics.increment('recoveries')
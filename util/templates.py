@@ -0,0 +1,209 @@
+import configparser
+import cv2
+import os
+import time
+from collections import deque
+from threading import Lock, Thread
+from util.logger import Logger
+from util.metrics import Metrics
+
+
+class Templates(object):
+
+    ASSET_DIR = 'assets'
+    REGION_MANIFEST = 'regions.ini'
+    LEARN_HITS = 5
+    LEARN_MARGIN = 20
+
+    images = {}
+    mtimes = {}
+    regions = {}
+    learnable = set()
+    learned_regions = {}
+    hit_history = {}
+    lock = Lock()
+    watcher = None
+
+    @classmethod
+    def load_all(cls):
+        """Loads every image in the assets directory into the cache as a
+        grayscale image.
+        """
+        with cls.lock:
+            for name, path in cls._asset_paths().items():
+                cls._load(name, path)
+        Logger.log_msg('Loaded {} templates.'.format(len(cls.images)))
+
+    @classmethod
+    def get(cls, name):
+        """Returns the cached grayscale image of the named asset, loading it
+        from disk if it is not cached yet. Lookups are counted as hits or
+        misses in the template_cache metric.
+
+        Args:
+            name (string): Name of the image.
+
+        Returns:
+            image: A CV2 image object containing the template, or None if the
+            asset does not exist.
+        """
+        with cls.lock:
+            template = cls.images.get(name)
+            cached = template is not None
+            if not cached:
+                template = cls._load(
+                    name, os.path.join(cls.ASSET_DIR, '{}.png'.format(name)))
+        Metrics.increment('template_cache', record=False,
+                          result='hit' if cached else 'miss')
+        return template
+
+    @classmethod
+    def reload_changed(cls):
+        """Reloads assets that were added or modified since they were cached
+        and drops assets that were deleted.
+        """
+        paths = cls._asset_paths()
+        with cls.lock:
+            for name in list(cls.images):
+                if name not in paths:
+                    Logger.log_msg('Template removed: {}'.format(name))
+                    del cls.images[name]
+                    del cls.mtimes[name]
+            for name, path in paths.items():
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if cls.mtimes.get(name) != mtime:
+                    Logger.log_msg('Template changed: {}'.format(name))
+                    cls._load(name, path)
+
+    @classmethod
+    def watch(cls, interval=5):
+        """Starts a background thread that checks the assets directory for
+        changes every interval seconds.
+
+        Args:
+            interval (int, optional): Defaults to 5. Seconds between checks.
+        """
+        if cls.watcher is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                cls.reload_changed()
+
+        cls.watcher = Thread(target=poll, daemon=True)
+        cls.watcher.start()
+
+    @classmethod
+    def load_regions(cls):
+        """Reads the declared search regions, and the templates whose region
+        may be learned, from the region manifest in the assets directory.
+        """
+        manifest = configparser.ConfigParser()
+        manifest.read(os.path.join(cls.ASSET_DIR, cls.REGION_MANIFEST))
+        with cls.lock:
+            cls.regions = {
+                name: tuple(int(value) for value in
+                            manifest.get(name, 'Region').split(','))
+                for name in manifest.sections()
+                if manifest.has_option(name, 'Region')}
+            cls.learnable = set(
+                name for name in manifest.sections()
+                if manifest.getboolean(name, 'Learn', fallback=False))
+        Logger.log_msg('Loaded {} search regions.'.format(len(cls.regions)))
+
+    @classmethod
+    def region(cls, name):
+        """Returns the area of the screen the named asset should be searched
+        in: the declared region if there is one, otherwise the region learned
+        from where it was previously found if it is learnable.
+
+        Args:
+            name (string): Name of the image.
+
+        Returns:
+            tuple: tuple containing the x, y, width and height of the region,
+            or None if the asset has no region
+        """
+        return cls.regions.get(name) or cls.learned_regions.get(name)
+
+    @classmethod
+    def declared(cls, name):
+        """Checks whether the named asset has a declared search region.
+
+        Args:
+            name (string): Name of the image.
+
+        Returns:
+            bool: True if the region manifest declares a region for the asset
+        """
+        return name in cls.regions
+
+    @classmethod
+    def record_hit(cls, name, x, y, width, height):
+        """Records where the named asset was found. Once it has been found
+        LEARN_HITS times, the bounding box of its recent hits padded by
+        LEARN_MARGIN becomes its learned search region. Only templates marked
+        learnable in the manifest are recorded: a region learned for a
+        template that moves, like an enemy or the fleet marker, would return
+        a weak match inside it instead of the best match elsewhere.
+
+        Args:
+            name (string): Name of the image.
+            x (int): x coordinate of the hit (top-left).
+            y (int): y coordinate of the hit (top-left).
+            width (int): Width of the image.
+            height (int): Height of the image.
+        """
+        if name in cls.regions or name not in cls.learnable:
+            return
+        with cls.lock:
+            history = cls.hit_history.setdefault(
+                name, deque(maxlen=cls.LEARN_HITS * 4))
+            history.append((x, y))
+            if len(history) < cls.LEARN_HITS:
+                return
+            x1 = max(0, min(hit[0] for hit in history) - cls.LEARN_MARGIN)
+            y1 = max(0, min(hit[1] for hit in history) - cls.LEARN_MARGIN)
+            x2 = max(hit[0] for hit in history) + width + cls.LEARN_MARGIN
+            y2 = max(hit[1] for hit in history) + height + cls.LEARN_MARGIN
+            cls.learned_regions[name] = (x1, y1, x2 - x1, y2 - y1)
+
+    @classmethod
+    def _asset_paths(cls):
+        """Lists the images in the assets directory.
+
+        Returns:
+            dict: dict of asset names to their paths
+        """
+        return {
+            os.path.splitext(filename)[0]: os.path.join(
+                cls.ASSET_DIR, filename)
+            for filename in os.listdir(cls.ASSET_DIR)
+            if filename.endswith('.png')}
+
+    @classmethod
+    def _load(cls, name, path):
+        """Reads the image at path into the cache. The caller must hold the
+        lock.
+
+        Args:
+            name (string): Name of the image.
+            path (string): Path of the image.
+
+        Returns:
+            image: A CV2 image object containing the template, or None if it
+            could not be read.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        template = cv2.imread(path, 0)
+        if template is not None:
+            cls.images[name] = template
+            cls.mtimes[name] = mtime
+        return template
@@ -0,0 +1,239 @@
+import re
+from util.adb import Adb
+from util.device import Device
+from util.logger import Logger
+from util.metrics import Metrics
+
+
+class Touchscreen(object):
+
+    MODES = ['input', 'sendevent']
+    SCREEN_WIDTH = 1280
+    SCREEN_HEIGHT = 720
+    SWIPE_STEPS = 10
+
+    @staticmethod
+    def configure(mode, node=None):
+        """Sets how input is injected into the active device.
+
+        input: use the 'input' command, which starts a JVM on the device for
+            every tap or swipe.
+        sendevent: write touch events to the touchscreen's /dev/input node
+            with sendevent, which is much cheaper per tap. The node is
+            detected with getevent unless one is specified; the touchscreen
+            must report landscape coordinates.
+
+        Args:
+            mode (string): One of MODES.
+            node (string, optional): Defaults to None. Path of the
+                touchscreen's input device, e.g. /dev/input/event1.
+        """
+        device = Device.current()
+        device.input_mode = mode
+        device.touch_node = node
+        device.touch_max_x = device.touch_max_y = None
+
+    @classmethod
+    def tap(cls, x, y):
+        """Builds the shell commands that tap the screen at the coordinates.
+
+        Args:
+            x (int): x coordinate of the tap.
+            y (int): y coordinate of the tap.
+
+        Returns:
+            list: list of shell commands
+        """
+        if cls._use_sendevent():
+            return cls._touch_down(x, y) + cls._touch_up()
+        return ['input tap {} {}'.format(x, y)]
+
+    @classmethod
+    def swipe(cls, x1, y1, x2, y2, ms):
+        """Builds the shell commands that swipe the screen between the
+        coordinates.
+
+        Args:
+            x1 (int): x coordinate to begin the swipe at.
+            y1 (int): y coordinate to begin the swipe at.
+            x2 (int): x coordinate to end the swipe at.
+            y2 (int): y coordinate to end the swipe at.
+            ms (int): Duration in ms of the swipe.
+
+        Returns:
+            list: list of shell commands
+        """
+        if not cls._use_sendevent():
+            return ['input swipe {} {} {} {} {}'.format(x1, y1, x2, y2, ms)]
+        commands = cls._touch_down(x1, y1)
+        for step in range(1, cls.SWIPE_STEPS + 1):
+            commands.append('sleep {:.3f}'.format(
+                ms / 1000 / cls.SWIPE_STEPS))
+            commands += cls._move(
+                x1 + (x2 - x1) * step / cls.SWIPE_STEPS,
+                y1 + (y2 - y1) * step / cls.SWIPE_STEPS)
+        return commands + cls._touch_up()
+
+    @staticmethod
+    def pause(seconds):
+        """Builds the shell command that pauses on the device between inputs.
+
+        Args:
+            seconds (float): Number of seconds to pause for.
+
+        Returns:
+            list: list of shell commands
+        """
+        return ['sleep {:.3f}'.format(seconds)]
+
+    @classmethod
+    def send(cls, commands):
+        """Sends the commands to the device as one shell script, so a whole
+        batch of inputs costs a single round trip. The script is given the
+        time its pauses and swipes take on top of the usual shell timeout.
+
+        Args:
+            commands (list): list of shell commands
+        """
+        with Metrics.timer('input_seconds'):
+            Adb.shell('; '.join(commands),
+                      Adb.SHELL_TIMEOUT + cls.duration(commands))
+
+    @staticmethod
+    def duration(commands):
+        """Returns how long the commands take to run on the device, counting
+        their pauses and the duration of input swipes.
+
+        Args:
+            commands (list): list of shell commands
+
+        Returns:
+            float: number of seconds
+        """
+        seconds = 0
+        for command in commands:
+            words = command.split(' ')
+            if words[0] == 'sleep':
+                seconds += float(words[1])
+            elif words[:2] == ['input', 'swipe']:
+                seconds += int(words[6]) / 1000
+        return seconds
+
+    @classmethod
+    def _use_sendevent(cls):
+        """Checks whether sendevent should be used, detecting the touchscreen
+        the first time. Falls back to the input command if no touchscreen can
+        be found.
+
+        Returns:
+            bool: True if input should be injected with sendevent
+        """
+        device = Device.current()
+        if device.input_mode != 'sendevent':
+            return False
+        if device.touch_max_x is None:
+            cls._detect()
+        if device.touch_max_x is None:
+            Logger.log_warning('No touchscreen found for sendevent, ' +
+                               'falling back to the input command.')
+            device.input_mode = 'input'
+            return False
+        return True
+
+    @classmethod
+    def _detect(cls):
+        """Finds the touchscreen and its coordinate range from the output of
+        getevent -pl: the first device (or the configured one) reporting
+        ABS_MT_POSITION_X and ABS_MT_POSITION_Y.
+        """
+        node, ranges = None, {}
+        for line in Adb.shell('getevent -pl').splitlines():
+            match = re.match(r'add device \d+: (\S+)', line)
+            if match:
+                if cls._set_ranges(node, ranges):
+                    return
+                node, ranges = match.group(1), {}
+                continue
+            match = re.search(
+                r'(ABS_MT_POSITION_[XY])\s*:.*max (\d+)', line)
+            if match:
+                ranges[match.group(1)] = int(match.group(2))
+        cls._set_ranges(node, ranges)
+
+    @staticmethod
+    def _set_ranges(node, ranges):
+        """Uses the input device if it is the configured one (or none is
+        configured) and it reports both touch axes.
+
+        Args:
+            node (string): Path of the input device.
+            ranges (dict): dict of the axis names to their maximum values.
+
+        Returns:
+            bool: True if the input device was picked
+        """
+        device = Device.current()
+        if (node is None or len(ranges) < 2 or
+                device.touch_node not in (None, node)):
+            return False
+        device.touch_node = node
+        device.touch_max_x = ranges['ABS_MT_POSITION_X']
+        device.touch_max_y = ranges['ABS_MT_POSITION_Y']
+        Logger.log_msg('Using touchscreen {}.'.format(node))
+        return True
+
+    @classmethod
+    def _events(cls, *events):
+        """Builds sendevent commands for the touchscreen.
+
+        Args:
+            events (tuple): (type, code, value) tuples.
+
+        Returns:
+            list: list of shell commands
+        """
+        node = Device.current().touch_node
+        return ['sendevent {} {} {} {}'.format(node, *event)
+                for event in events]
+
+    @classmethod
+    def _move(cls, x, y):
+        """Builds the events that move the touch point to the coordinates.
+
+        Args:
+            x (int): x coordinate on the screen.
+            y (int): y coordinate on the screen.
+
+        Returns:
+            list: list of shell commands
+        """
+        device = Device.current()
+        return cls._events(
+            (3, 53, int(x * device.touch_max_x / (cls.SCREEN_WIDTH - 1))),
+            (3, 54, int(y * device.touch_max_y / (cls.SCREEN_HEIGHT - 1))),
+            (0, 0, 0))
+
+    @classmethod
+    def _touch_down(cls, x, y):
+        """Builds the events that put a finger down at the coordinates.
+
+        Args:
+            x (int): x coordinate on the screen.
+            y (int): y coordinate on the screen.
+
+        Returns:
+            list: list of shell commands
+        """
+        device = Device.current()
+        device.touch_tracking_id = (device.touch_tracking_id + 1) % 65536
+        return (cls._events((3, 57, device.touch_tracking_id)) +
+                cls._move(x, y)[:2] + cls._events((1, 330, 1), (0, 0, 0)))
+
+    @classmethod
+    def _touch_up(cls):
+        """Builds the events that lift the finger.
+
+        Returns:
+            list: list of shell commands
+        """
+        return cls._events((3, 57, 4294967295), (1, 330, 0), (0, 0, 0))
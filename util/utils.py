@@ -1,10 +1,21 @@
+import copy
 import cv2
 import numpy
+import struct
 import time
 from datetime import datetime, timedelta
 from random import uniform, gauss, randint
 from scipy import spatial
 from util.adb import Adb
+from util.device import Device
+from util.logger import Logger
+from util.match_pool import MatchPool
+from util.metrics import Metrics
+from util.matching import Matcher, SpectrumMatcher
+from util.polling import PollingStrategy
+from util.screen import ChangeDetector, MotionEstimator, ScreenStream
+from util.templates import Templates
+from util.touchscreen import Touchscreen
 
 
 class Region(object):
@@ -28,28 +39,101 @@ class Region(object):
 class Utils(object):
 
     DEFAULT_SIMILARITY = 0.95
+    MOTION_MARGIN = 8
+    RAW_PIXEL_FORMATS = {
+        1: cv2.COLOR_RGBA2GRAY,
+        2: cv2.COLOR_RGBA2GRAY,
+        5: cv2.COLOR_BGRA2GRAY
+    }
+
+    max_frame_age = None
+    match_pool = None
+    match_workers = 0
+    spectrum_matching = True
+    search_regions = True
+    region_fallback = True
+    pyramid_levels = 2
+    polling = PollingStrategy()
+    gate_threshold = 8
+    max_captures_per_second = 0
+
+    @classmethod
+    def init(cls, config):
+        """Applies the Screen settings of the passed in Config instance, which
+        are shared by every device, preloading the templates and starting the
+        asset watcher if it is enabled.
+
+        Args:
+            config (Config): azurlane-auto Config instance
+        """
+        cls.max_frame_age = config.screen['max_frame_age']
+        cls.search_regions = config.screen['search_regions']
+        cls.region_fallback = config.screen['region_fallback']
+        cls.pyramid_levels = config.screen['pyramid_levels']
+        cls.polling = PollingStrategy(
+            config.screen['polling'], config.screen['poll_interval'],
+            config.screen['poll_max_interval'])
+        cls.gate_threshold = config.screen['gate_threshold']
+        cls.max_captures_per_second = config.screen[
+            'max_captures_per_second']
+        cls.spectrum_matching = config.screen['spectrum_matching']
+        if config.screen['match_workers'] != cls.match_workers:
+            cls.match_workers = config.screen['match_workers']
+            if cls.match_pool is not None:
+                cls.match_pool.shutdown()
+                cls.match_pool = None
+        Templates.load_all()
+        Templates.load_regions()
+        if config.screen['watch_assets']:
+            Templates.watch()
+
+    @classmethod
+    def init_device(cls, config):
+        """Sets up the active device with the Screen and Input settings of the
+        passed in Config instance, starting its background screen stream if
+        streaming is enabled.
+
+        Args:
+            config (Config): azurlane-auto Config instance
+        """
+        device = Device.current()
+        device.capture_mode = config.screen['capture_mode']
+        device.frame_gate = (
+            ChangeDetector(config.screen['gate_threshold'])
+            if config.screen['frame_gating'] else None)
+        Touchscreen.configure(config.input['mode'], config.input['device'])
+        if device.stream is not None:
+            device.stream.stop()
+            device.stream = None
+        if config.screen['streaming']:
+            device.stream = ScreenStream(
+                device.bind(cls.capture_screen),
+                config.screen['stream_buffer'])
+            device.stream.start()
 
     @staticmethod
     def multithreader(threads):
         """Method for starting and threading multithreadable Threads in
-        threads.
+        threads. The threads act on the device active in the calling thread.
 
         Args:
             threads (list): List of Threads to multithread.
         """
+        device = Device.current()
         for thread in threads:
+            thread.run = device.bind(thread.run)
             thread.start()
         for thread in threads:
             thread.join()
 
-    @staticmethod
-    def script_sleep(base=None, flex=None):
+    @classmethod
+    def script_sleep(cls, base=None, flex=None):
         """Method for putting the program to sleep for a random amount of time.
         If base is not provided, defaults to somewhere along with 0.3 and 0.7
         seconds. If base is provided, the sleep length will be between base
         and 2*base. If base and flex are provided, the sleep length will be
-        between base and base+flex. The global SLEEP_MODIFIER is than added to
-        this for the final sleep length.
+        between base and base+flex. When a virtual clock is set, it is
+        advanced instead of actually sleeping.
 
         Args:
             base (int, optional): Minimum amount of time to go to sleep for.
@@ -57,68 +141,620 @@ class Utils(object):
                 to sleep for.
         """
         if base is None:
-            time.sleep(uniform(0.3, 0.7))
+            duration = uniform(0.3, 0.7)
         else:
             flex = base if flex is None else flex
-            time.sleep(uniform(base, base + flex))
+            duration = uniform(base, base + flex)
+        cls.sleep(duration)
+
+    @classmethod
+    def sleep(cls, seconds):
+        """Sleeps for the specified number of seconds, advancing the virtual
+        clock instead if one is set.
+
+        Args:
+            seconds (float): Number of seconds to sleep for.
+        """
+        if seconds <= 0:
+            return
+        clock = Device.current().clock
+        if clock is None:
+            time.sleep(seconds)
+        else:
+            clock.sleep(seconds)
+
+    @classmethod
+    def now(cls):
+        """Returns the current time, as told by the virtual clock if one is
+        set.
+
+        Returns:
+            datetime: the current time
+        """
+        clock = Device.current().clock
+        return datetime.now() if clock is None else clock.now()
+
+    @classmethod
+    def update_screen(cls, max_age=None):
+        """Returns the current device screen. If the screen stream is running,
+        the newest streamed frame no older than max_age is returned, otherwise
+        a new screenshot is captured.
+
+        Args:
+            max_age (float, optional): Defaults to the configured MaxFrameAge.
+                Maximum age in seconds of a streamed frame.
+
+        Returns:
+            image: A CV2 image object containing the current device screen.
+        """
+        stream = Device.current().stream
+        if stream is not None:
+            screen = stream.latest(
+                cls.max_frame_age if max_age is None else max_age)
+        else:
+            screen = cls.capture_screen()
+        return cls._gate(screen)
+
+    @classmethod
+    def _gate(cls, screen):
+        """Passes the screen through the frame gate: if it has not changed
+        since the current frame, the current frame is returned so results
+        memoized for it can be reused; otherwise it becomes the current frame
+        and the memo is cleared.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+
+        Returns:
+            image: the screen, or the current frame if the screen is unchanged
+        """
+        device = Device.current()
+        if device.frame_gate is None:
+            return screen
+        with device.memo_lock:
+            if device.frame_gate.changed(screen):
+                device.current_frame = screen
+                device.memo = {}
+            return device.current_frame
+
+    @classmethod
+    def _memoized(cls, screen, key, compute):
+        """Returns the memoized result for the key if the screen is the current
+        frame, computing and memoizing it otherwise.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            key (tuple): Key identifying the query.
+            compute (function): Function computing the result.
+
+        Returns:
+            any: the result of the query
+        """
+        found, result = cls._recall(screen, key)
+        if not found:
+            with Metrics.timer('match_seconds', kind=key[0]):
+                result = compute()
+            cls._remember(screen, key, result)
+        return result
 
     @staticmethod
-    def update_screen():
+    def _recall(screen, key):
+        """Looks up the memoized result for the key if the screen is the
+        current frame. A copy is returned, callers are free to change it.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            key (tuple): Key identifying the query.
+
+        Returns:
+            tuple: whether a result was memoized, and the result
+        """
+        device = Device.current()
+        with device.memo_lock:
+            if screen is device.current_frame and key in device.memo:
+                return True, copy.copy(device.memo[key])
+        return False, None
+
+    @staticmethod
+    def _remember(screen, key, result):
+        """Memoizes a copy of the result for the key if the screen is the
+        current frame.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            key (tuple): Key identifying the query.
+            result (any): The result of the query.
+        """
+        device = Device.current()
+        with device.memo_lock:
+            if screen is device.current_frame:
+                device.memo[key] = copy.copy(result)
+
+    @classmethod
+    def capture_screen(cls):
         """Uses ADB to pull a screenshot of the device and then read it via CV2
-        and then returns the read image.
+        and then returns the read image. Uses the raw framebuffer dump unless
+        the capture mode of the device is 'png' or the raw dump could not be
+        parsed, in which case the device switches to the PNG screencap.
+        Captures are spaced out to stay under max_captures_per_second.
 
         Returns:
             image: A CV2 image object containing the current device screen.
         """
+        device = Device.current()
+        with device.capture_lock:
+            if (cls.max_captures_per_second > 0 and
+                    device.last_capture is not None):
+                cls.sleep((device.last_capture - cls.now()).total_seconds() +
+                          1 / cls.max_captures_per_second)
+            device.last_capture = cls.now()
         decoded = None
-        while decoded is None:
-            decoded = cv2.imdecode(
-                numpy.fromstring(
-                    Adb.exec_out('screencap -p'), dtype=numpy.uint8), 0)
+        with Metrics.timer('capture_seconds', mode=device.capture_mode):
+            while decoded is None:
+                if device.capture_mode == 'raw':
+                    decoded = cls.decode_raw_screencap(
+                        Adb.exec_out('screencap'))
+                    if decoded is None:
+                        Logger.log_warning('Unable to parse raw screencap, ' +
+                                           'falling back to PNG capture.')
+                        device.capture_mode = 'png'
+                else:
+                    decoded = cv2.imdecode(
+                        numpy.frombuffer(
+                            Adb.exec_out('screencap -p'),
+                            dtype=numpy.uint8), 0)
         return decoded
 
     @classmethod
-    def find(cls, image, similarity=DEFAULT_SIMILARITY):
+    def decode_raw_screencap(cls, data):
+        """Parses the output of a raw (non-PNG) screencap and converts it to a
+        grayscale image. The header is 12 bytes (width, height, format) on
+        older Android versions and 16 bytes (plus colorspace) on Android 9+;
+        the pixel data is viewed in place rather than copied.
+
+        Args:
+            data (bytes): Output of 'screencap'.
+
+        Returns:
+            image: A CV2 image object containing the screen, or None if the
+            data could not be parsed.
+        """
+        if len(data) < 12:
+            return None
+        width, height, pixel_format = struct.unpack_from('<III', data)
+        size = width * height * 4
+        header = len(data) - size
+        if (header not in (12, 16) or
+                pixel_format not in cls.RAW_PIXEL_FORMATS):
+            return None
+        pixels = numpy.frombuffer(
+            data, dtype=numpy.uint8, count=size, offset=header).reshape(
+                height, width, 4)
+        return cv2.cvtColor(pixels, cls.RAW_PIXEL_FORMATS[pixel_format])
+
+    @classmethod
+    def find(cls, image, similarity=DEFAULT_SIMILARITY, pyramid=False):
         """Finds the specified image on the screen
 
         Args:
-            image (string): [description]
+            image (string): Name of the image.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the image should at least match.
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+
+        Returns:
+            Region: region object containing the location and size of the image
+        """
+        return cls.match(cls.update_screen(), image, similarity, pyramid)
+
+    @classmethod
+    def match(cls, screen, image, similarity=DEFAULT_SIMILARITY,
+              pyramid=False):
+        """Finds the specified image on an already captured screen. If search
+        regions are enabled and the image has one, only that part of the
+        screen is searched, falling back to the full screen if enabled. The
+        result is reused while the screen has not changed.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            image (string): Name of the image.
             similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
                 Percentage in similarity that the image should at least match.
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
 
         Returns:
             Region: region object containing the location and size of the image
         """
-        screen = cls.update_screen()
-        template = cv2.imread('assets/{}.png'.format(image), 0)
+        return cls._memoized(
+            screen, ('match', image, similarity, pyramid),
+            lambda: cls._search(screen, image, similarity, pyramid))
+
+    @classmethod
+    def _search(cls, screen, image, similarity, pyramid):
+        """Finds the specified image on the screen, searching its region first
+        if it has one. See match.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            image (string): Name of the image.
+            similarity (float): Percentage in similarity that the image should
+                at least match.
+            pyramid (bool): Whether to match coarse to fine instead of
+                exhaustively.
+
+        Returns:
+            Region: region object containing the location and size of the image
+        """
+        template = Templates.get(image)
         width, height = template.shape[::-1]
-        match = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
-        value, location = cv2.minMaxLoc(match)[1], cv2.minMaxLoc(match)[3]
+        roi = Templates.region(image) if cls.search_regions else None
+        if roi is not None:
+            x, y = max(0, roi[0]), max(0, roi[1])
+            sub_screen = screen[y:roi[1] + roi[3], x:roi[0] + roi[2]]
+            if (sub_screen.shape[0] >= height and
+                    sub_screen.shape[1] >= width):
+                region = cls._match_template(
+                    sub_screen, template, similarity, pyramid)
+                if region is not None:
+                    region.x += x
+                    region.y += y
+                    return region
+            if not cls._falls_back(image):
+                return None
+        region = cls._match_template(screen, template, similarity, pyramid)
+        if region is not None and cls.search_regions:
+            Templates.record_hit(image, region.x, region.y, width, height)
+        return region
+
+    @classmethod
+    def _falls_back(cls, image):
+        """Checks whether the full screen is searched for the image when it
+        is not found in its region. Declared regions are exact, so only
+        learned regions fall back, and only if RegionFallback is enabled:
+        most checks are negative and would otherwise pay for two searches.
+
+        Args:
+            image (string): Name of the image.
+
+        Returns:
+            bool: True if the full screen should be searched
+        """
+        return cls.region_fallback and not Templates.declared(image)
+
+    @classmethod
+    def _match_template(cls, screen, template, similarity, pyramid=False):
+        """Finds the best match of the template on the screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            template (image): A CV2 image object containing the template.
+            similarity (float): Percentage in similarity that the template
+                should at least match.
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+
+        Returns:
+            Region: region object containing the location and size of the
+            template
+        """
+        width, height = template.shape[::-1]
+        match = cls._response(screen, template, similarity, pyramid)
+        value, location = cv2.minMaxLoc(match)[1::2]
         if (value >= similarity):
             return Region(location[0], location[1], width, height)
         return None
 
     @classmethod
-    def find_all(cls, image, similarity=DEFAULT_SIMILARITY):
+    def _response(cls, screen, template, similarity, pyramid=False):
+        """Computes the response map of the template over the screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            template (image): A CV2 image object containing the template.
+            similarity (float): Percentage in similarity that the template
+                should at least match.
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+
+        Returns:
+            ndarray: The response map, one value per template position
+        """
+        if pyramid:
+            return Matcher.pyramid_response(
+                screen, template, similarity, cls.pyramid_levels)
+        return Matcher.response(screen, template)
+
+    @classmethod
+    def detect_all(cls, frame, templates, similarity=DEFAULT_SIMILARITY,
+                   parallel=False):
+        """Matches every template against the same captured frame.
+
+        Args:
+            frame (image): A CV2 image object containing the screen.
+            templates (list): Names of the images, or (name, similarity)
+                tuples to override the similarity for that image.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the images should at least match
+            parallel (bool, optional): Defaults to False. Whether to match the
+                templates concurrently in the match pool.
+
+        Returns:
+            dict: dict of the names of the images found to their Regions
+        """
+        jobs = cls._detection_jobs(templates, similarity)
+        if parallel:
+            results = cls.match_many(frame, jobs)
+        else:
+            results = [cls.match(frame, name, sim) for name, sim in jobs]
+        return {job[0]: region for job, region in zip(jobs, results)
+                if region is not None}
+
+    @classmethod
+    def match_many(cls, screen, jobs, pyramid=False):
+        """Finds several images on an already captured screen like match does,
+        fanning the searches out across the match pool: every image is first
+        searched in its region, then the images that were not found there are
+        searched on the full screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            jobs (list): list of (name, similarity) tuples.
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+
+        Returns:
+            list: list of Regions of the images, None for images not found
+        """
+        keys = [('match', name, sim, pyramid) for name, sim in jobs]
+        recalled = [cls._recall(screen, key) for key in keys]
+        results = [result for _, result in recalled]
+        pending = [i for i, (found, _) in enumerate(recalled) if not found]
+        rois = {i: Templates.region(jobs[i][0]) if cls.search_regions
+                else None for i in pending}
+        searches = [pending]
+        while searches:
+            indexes = searches.pop()
+            requests = [
+                (jobs[i][0], rois[i], jobs[i][1],
+                 cls.pyramid_levels if pyramid else 0, False)
+                for i in indexes]
+            fallback = []
+            with Metrics.timer('match_seconds', kind='match_many'):
+                found = cls._pool().map(screen, requests)
+            for i, (value, x, y) in zip(indexes, found):
+                name = jobs[i][0]
+                if value >= jobs[i][1]:
+                    height, width = Templates.get(name).shape
+                    results[i] = Region(x, y, width, height)
+                    if rois[i] is None and cls.search_regions:
+                        Templates.record_hit(name, x, y, width, height)
+                elif rois[i] is not None and cls._falls_back(name):
+                    rois[i] = None
+                    fallback.append(i)
+            if fallback:
+                searches.append(fallback)
+        for i in pending:
+            cls._remember(screen, keys[i], results[i])
+        return results
+
+    @classmethod
+    def detect_any(cls, frame, templates, similarity=DEFAULT_SIMILARITY,
+                   parallel=False):
+        """Matches the templates in order against the same captured frame and
+        returns the first one found. Matching stops at the first hit unless
+        parallel is set, in which case all templates are matched at once and
+        the first in order is kept.
+
+        Args:
+            frame (image): A CV2 image object containing the screen.
+            templates (list): Names of the images, or (name, similarity)
+                tuples to override the similarity for that image.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the images should at least match
+            parallel (bool, optional): Defaults to False. Whether to match the
+                templates concurrently across cores.
+
+        Returns:
+            dict: dict containing the name of the first image found and its
+            Region, empty if none were found
+        """
+        jobs = cls._detection_jobs(templates, similarity)
+        if parallel:
+            hits = cls.detect_all(frame, jobs, similarity, True)
+            for name, _ in jobs:
+                if name in hits:
+                    return {name: hits[name]}
+            return {}
+        for name, sim in jobs:
+            region = cls.match(frame, name, sim)
+            if region is not None:
+                return {name: region}
+        return {}
+
+    @staticmethod
+    def _detection_jobs(templates, similarity):
+        """Normalizes a list of template names and (name, similarity) tuples
+        into a list of (name, similarity) tuples.
+
+        Args:
+            templates (list): Names of the images, or (name, similarity)
+                tuples.
+            similarity (float): Similarity to use for bare names.
+
+        Returns:
+            list: list of (name, similarity) tuples
+        """
+        return [(template, similarity) if isinstance(template, str)
+                else tuple(template) for template in templates]
+
+    @classmethod
+    def _pool(cls):
+        """Returns the pool used for parallel matching, creating it on first
+        use.
+
+        Returns:
+            MatchPool: the match pool
+        """
+        if cls.match_pool is None:
+            cls.match_pool = MatchPool(cls.match_workers)
+        return cls.match_pool
+
+    @classmethod
+    def find_all(cls, image, similarity=DEFAULT_SIMILARITY, pyramid=False,
+                 scores=False):
         """Finds all locations of the image on the screen
 
         Args:
             image (string): Name of the image.
             similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
                 Percentage in similarity that the image should at least match
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+            scores (bool, optional): Defaults to False. Whether to return the
+                confidence of each location as well.
 
         Returns:
-            array: Array of all coordinates where the image appears
+            array: Array of all coordinates where the image appears, best
+            match first; (x, y, confidence) tuples if scores is set
         """
-        screen = cls.update_screen()
-        template = cv2.imread('assets/{}.png'.format(image), 0)
-        width, height = template.shape[::-1]
-        match = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
-        locations = numpy.where(match >= similarity)
-        if locations:
-            return cls.filter_similar_coords(
-                list(zip(locations[1], locations[0])))
-        return None
+        return cls.match_all(
+            cls.update_screen(), image, similarity, pyramid, scores)
+
+    @classmethod
+    def match_all(cls, screen, image, similarity=DEFAULT_SIMILARITY,
+                  pyramid=False, scores=False):
+        """Finds all locations of the image on an already captured screen,
+        keeping only the best location per object. The result is reused while
+        the screen has not changed.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            image (string): Name of the image.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the image should at least match
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+            scores (bool, optional): Defaults to False. Whether to return the
+                confidence of each location as well.
+
+        Returns:
+            array: Array of all coordinates where the image appears, best
+            match first; (x, y, confidence) tuples if scores is set
+        """
+        peaks = cls._memoized(
+            screen, ('match_all', image, similarity, pyramid),
+            lambda: Matcher.peaks(cls._response(
+                screen, Templates.get(image), similarity, pyramid),
+                similarity))
+        if scores:
+            return list(peaks)
+        return [(x, y) for x, y, _ in peaks]
+
+    @classmethod
+    def match_all_many(cls, screen, images, similarity=DEFAULT_SIMILARITY,
+                       pyramid=False, scores=False):
+        """Finds all locations of several images on an already captured screen
+        like match_all does, fanning the searches out across the match pool,
+        or with spectrum matching, correlating them all against one Fourier
+        transform of the screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            images (list): Names of the images.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the images should at least match
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
+            scores (bool, optional): Defaults to False. Whether to return the
+                confidence of each location as well.
+
+        Returns:
+            dict: dict of the names of the images to their coordinates, see
+            match_all
+        """
+        keys = [('match_all', image, similarity, pyramid) for image in images]
+        recalled = [cls._recall(screen, key) for key in keys]
+        pending = [i for i, (found, _) in enumerate(recalled) if not found]
+        with Metrics.timer('match_seconds', kind='match_all_many'):
+            if cls.spectrum_matching and not pyramid and len(pending) > 1:
+                matcher = SpectrumMatcher(screen)
+                found = [Matcher.peaks(matcher.response(
+                    Templates.get(images[i]), images[i]), similarity)
+                    for i in pending]
+            else:
+                found = cls._pool().map(screen, [
+                    (images[i], None, similarity,
+                     cls.pyramid_levels if pyramid else 0, True)
+                    for i in pending])
+        peaks = [result for _, result in recalled]
+        for i, result in zip(pending, found):
+            peaks[i] = result
+            cls._remember(screen, keys[i], result)
+        return {image: list(result) if scores
+                else [(x, y) for x, y, _ in result]
+                for image, result in zip(images, peaks)}
+
+    @classmethod
+    def match_all_moved(cls, screen, image, coords, offset,
+                        similarity=DEFAULT_SIMILARITY):
+        """Finds all locations of the image on a screen whose content moved by
+        the offset since the coordinates were found on the previous screen,
+        e.g. after a swipe. The coordinates are moved by the offset instead of
+        being matched again, and only the strips of the screen revealed by
+        the move are searched, so the cost scales with the revealed area
+        rather than the whole screen.
+
+        Args:
+            screen (image): A CV2 image object containing the screen.
+            image (string): Name of the image.
+            coords (array): Array of coordinates of the image on the previous
+                screen.
+            offset (tuple): (x, y) offset in pixels the content moved by, see
+                MotionEstimator.
+            similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
+                Percentage in similarity that the image should at least match
+
+        Returns:
+            array: Array of all coordinates where the image appears, newly
+            revealed matches first, best match first
+        """
+        template = Templates.get(image)
+        height, width = screen.shape[:2]
+        template_height, template_width = template.shape[:2]
+        x, y = offset
+        moved = [(cx + x, cy + y) for cx, cy in coords
+                 if 0 <= cx + x <= width - template_width and
+                 0 <= cy + y <= height - template_height]
+        # Matches starting less than the offset from the edge the content
+        # moved away from were cut off before; the margin covers estimation
+        # error
+        strip_width = abs(x) + template_width + cls.MOTION_MARGIN
+        strip_height = abs(y) + template_height + cls.MOTION_MARGIN
+        strips = []
+        if x:
+            strips.append([0 if x > 0 else width - strip_width, 0,
+                           strip_width, height])
+        if y:
+            strips.append([0, 0 if y > 0 else height - strip_height,
+                           width, strip_height])
+        found = []
+        with Metrics.timer('match_seconds', kind='match_all_moved'):
+            for strip_x, strip_y, strip_w, strip_h in strips:
+                strip_x, strip_y = max(0, strip_x), max(0, strip_y)
+                strip = screen[strip_y:strip_y + strip_h,
+                               strip_x:strip_x + strip_w]
+                if (strip.shape[0] < template_height or
+                        strip.shape[1] < template_width):
+                    continue
+                found += [(px + strip_x, py + strip_y, value)
+                          for px, py, value in Matcher.peaks(
+                              Matcher.response(strip, template), similarity)]
+        found.sort(key=lambda peak: -peak[2])
+        coords = [(px, py) for px, py, _ in found] + moved
+        return cls.filter_similar_coords(
+            coords, [value for _, _, value in found] + [-1] * len(moved))
 
     @classmethod
     def touch(cls, coords):
@@ -129,7 +765,27 @@ class Utils(object):
             coords (array): An array containing the x and y coordinate of
                 where to touch the screen
         """
-        Adb.shell("input tap {} {}".format(coords[0], coords[1]))
+        Touchscreen.send(Touchscreen.tap(coords[0], coords[1]))
+        cls.script_sleep()
+
+    @classmethod
+    def touch_many(cls, regions):
+        """Touches a random coordinate in each of the specified regions, in
+        order, sending all of the touches to the device as one batch. The
+        pauses between touches happen on the device.
+
+        Args:
+            regions (list): List of Regions to touch.
+        """
+        commands = []
+        for region in regions:
+            if commands:
+                commands += Touchscreen.pause(uniform(0.3, 0.7))
+            commands += Touchscreen.tap(
+                cls.random_coord(region.x, region.x + region.w),
+                cls.random_coord(region.y, region.y + region.h))
+        if commands:
+            Touchscreen.send(commands)
         cls.script_sleep()
 
     @classmethod
@@ -156,7 +812,7 @@ class Utils(object):
             y2 (int): y-coordinate to begin the swipe at.
             ms (int): Duration in ms of swipe.
         """
-        Adb.shell("input swipe {} {} {} {} {}".format(x1, y1, x2, y2, ms))
+        Touchscreen.send(Touchscreen.swipe(x1, y1, x2, y2, ms))
 
     @classmethod
     def find_and_touch(cls, image, similarity=DEFAULT_SIMILARITY):
@@ -191,10 +847,12 @@ class Utils(object):
         Returns:
             bool: True if the image was found and touched, false otherwise
         """
-        limit = datetime.now() + timedelta(seconds=seconds)
-        while (datetime.now() < limit):
-            if cls.find_and_touch(image, similarity):
-                return True
+        region = cls.poll(
+            lambda screen: cls.match(screen, image, similarity), seconds,
+            image)
+        if region is not None:
+            cls.touch_randomly(region)
+            return True
         return False
 
     @classmethod
@@ -209,24 +867,14 @@ class Utils(object):
         Returns:
             bool: True if any images were touched, false otherwise
         """
-        screen = cls.update_screen()
-        template = cv2.imread('assets/{}.png'.format(image), 0)
+        template = Templates.get(image)
         width, height = template.shape[::-1]
-        match = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
-        locations = numpy.where(match >= similarity)
-        if locations:
-            for i in range(0, len(locations[0])):
-                x1 = locations[1][i]
-                x2 = x1 + width
-                y1 = locations[0][i]
-                y2 = y1 + height
-                cls.touch([cls.random_coord(x1, x2),
-                           cls.random_coord(y1, y2)])
-                cls.script_sleep(1)
-                cls.touch_randomly
-                cls.script_sleep(1)
-            return True
-        return False
+        locations = cls.find_all(image, similarity)
+        for x1, y1 in locations:
+            cls.touch([cls.random_coord(x1, x1 + width),
+                       cls.random_coord(y1, y1 + height)])
+            cls.script_sleep(1)
+        return len(locations) > 0
 
     @classmethod
     def wait_and_find(cls, image, seconds, similarity=DEFAULT_SIMILARITY):
@@ -244,17 +892,16 @@ class Utils(object):
             region: Returns Region object containing the location and size of
             the image if found
         """
-        limit = datetime.now() + timedelta(seconds=seconds)
-        while (datetime.now() < limit):
-            region = cls.find(image, similarity)
-            if region is not None:
-                return region
-        return None
+        return cls.poll(
+            lambda screen: cls.match(screen, image, similarity), seconds,
+            image)
 
     @classmethod
     def scroll_find(cls, image, x_dist, y_dist,
-                    similarity=DEFAULT_SIMILARITY):
+                    similarity=DEFAULT_SIMILARITY, pyramid=False):
         """Looks around the screen in a clockwise direction for the image.
+        After each swipe, only the part of the screen the swipe revealed is
+        searched, unless the movement of the screen cannot be estimated.
 
         Args:
             image (string): Name of the image.
@@ -262,17 +909,36 @@ class Utils(object):
             y_dist (int): Distance in which to swipe the screen vertically.
             similarity (float, optional): Defaults to DEFAULT_SIMILARITY.
                 Percentage in similarity that the image should at least match
+            pyramid (bool, optional): Defaults to False. Whether to match
+                coarse to fine instead of exhaustively.
         """
         swipe_areas = [
             [640, 360 - y_dist, 640, 360 + y_dist, 300],
             [640 + x_dist, 360, 640 - x_dist, 360, 300],
             [640, 360 + y_dist * 1.5, 640, 360 - y_dist * 1.5, 300],
             [640 - x_dist * 1.5, 360, 640 + x_dist * 1.5, 360, 300]]
+        template = Templates.get(image)
+        previous, expected = None, (0, 0)
         for area in swipe_areas:
-            region = cls.find(image, similarity)
+            screen = cls.update_screen()
+            offset = None
+            if previous is not None:
+                offset = MotionEstimator.offset(previous, screen, expected)
+            if offset is None:
+                region = cls.match(screen, image, similarity, pyramid)
+            else:
+                # The image was not on the previous screen, so it can only
+                # be in the part the swipe revealed
+                found = cls.match_all_moved(
+                    screen, image, [], offset, similarity)
+                region = None if not found else Region(
+                    found[0][0], found[0][1],
+                    template.shape[1], template.shape[0])
             if region is not None:
                 return region
             Utils.swipe(area[0], area[1], area[2], area[3], area[4])
+            previous = screen
+            expected = (area[2] - area[0], area[3] - area[1])
         return None
 
     @classmethod
@@ -303,11 +969,49 @@ class Utils(object):
         Returns:
             bool: True if the image exists on the screen, false otherwise
         """
-        limit = datetime.now() + timedelta(seconds=duration)
-        while (datetime.now() < limit):
-            if cls.exists(image, similarity):
-                return True
-        return False
+        return cls.poll(
+            lambda screen: cls.match(screen, image, similarity),
+            duration, image) is not None
+
+    @classmethod
+    def poll(cls, check, seconds, target):
+        """Repeatedly captures the screen and passes it to check until check
+        returns something other than None or the specified number of seconds
+        have passed, pausing between checks according to the polling
+        strategy. The number of captures made is stored in the active
+        device's last_wait_captures and added to the wait_captures histogram.
+        The waits of Utils are built on it, and it serves waits on anything
+        else that can be read off the screen, like the scene.
+
+        Args:
+            check (function): Function taking the screen and returning None
+                if the wait should go on.
+            seconds (int): Number of seconds to keep checking for.
+            target (string): What is waited for, e.g. the name of the image;
+                labels the wait in the metrics.
+
+        Returns:
+            any: The last result of check
+        """
+        limit = cls.now() + timedelta(seconds=seconds)
+        delays = cls.polling.delays()
+        detector = ChangeDetector(cls.gate_threshold)
+        captures = 0
+        result = None
+        while True:
+            screen = cls.update_screen()
+            captures += 1
+            if detector.changed(screen) or not cls.polling.on_change:
+                result = check(screen)
+                if result is not None:
+                    break
+            if cls.now() >= limit:
+                break
+            cls.sleep(min(next(delays),
+                          (limit - cls.now()).total_seconds()))
+        Device.current().last_wait_captures = captures
+        Metrics.observe('wait_captures', captures, target=target)
+        return result
 
     @classmethod
     def random_coord(cls, min_val, max_val):
@@ -359,23 +1063,27 @@ class Utils(object):
 
         return int(max(min_val, min(gauss(mu, sigma), max_val)))
 
-    @classmethod
-    def filter_similar_coords(cls, coords):
-        """Filters out coordinates that are close to each other.
+    @staticmethod
+    def filter_similar_coords(coords, scores=None):
+        """Filters out coordinates that are close to each other, keeping the
+        highest scoring coordinate of each group if scores are provided and
+        the first one otherwise.
 
         Args:
             coords (array): An array containing the coordinates to be filtered.
+            scores (array, optional): Defaults to None. Scores of the
+                coordinates.
 
         Returns:
             array: An array containing the filtered coordinates.
         """
-        filtered_coords = []
-        if len(coords) > 0:
-            filtered_coords.append(coords[0])
-            for coord in coords:
-                if cls.find_closest(filtered_coords, coord)[0] > 10:
-                    filtered_coords.append(coord)
-        return filtered_coords
+        if len(coords) == 0:
+            return []
+        coords = numpy.asarray(coords)
+        if scores is None:
+            scores = -numpy.arange(len(coords))
+        return [(x, y) for x, y, _ in Matcher.suppress(
+            coords[:, 0], coords[:, 1], scores)]
 
     @staticmethod
     def find_closest(coords, coord):